@@ -3,20 +3,45 @@ import numpy as np
 import os
 import rasterio
 import glob
+import joblib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
+from keras import mixed_precision
 from keras.models import Sequential, load_model
 from keras.layers import Dense
 from keras.utils import to_categorical
 from sklearn.impute import SimpleImputer
+from cropclassification.raster_utils import thread_local_readers, tile_windows
 
-def training_fnn_model(base_dir:str, training_dataset:list, model_name:str, epochs=50, batch_size=32, validation_split=0.2):
+try:
+    import tf2onnx
+except ImportError:
+    tf2onnx = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:
+    onnxruntime = None
+
+# Number of pixels classified per inference call
+PREDICT_BATCH_SIZE = 65536
+
+def training_fnn_model(base_dir:str, training_dataset:str, model_name:str, epochs=50, batch_size=32, validation_split=0.2):
     """
     Train a Feedforward Neural Network (FNN) on given dataset and make predictions on raster layers.
 
     Parameters:
     - base_dir (str): Base directory path.
     - feature_data (list): List of paths to raster layers.
-    - dataset (str): Path to the training dataset in Excel format.
+    - training_dataset (str): Path to the training dataset in Excel, Parquet or Feather format.
     - model_name (str): Name of the saved FNN model file.
     - epochs (int): Number of training epochs for the FNN model.
     - batch_size (int): Batch size for training the FNN model.
@@ -26,8 +51,10 @@ def training_fnn_model(base_dir:str, training_dataset:list, model_name:str, epoc
     Returns:
     None
     """
-    # Open database
-    class_samples = pd.read_excel(training_dataset)
+    # Open database, Parquet and Feather files load much faster than Excel
+    dataset_readers = {'.parquet': pd.read_parquet, '.feather': pd.read_feather}
+    read_dataset = dataset_readers.get(os.path.splitext(training_dataset)[1].lower(), pd.read_excel)
+    class_samples = read_dataset(training_dataset)
     class_samples = class_samples.dropna()
 
     # Select X and y
@@ -42,21 +69,44 @@ def training_fnn_model(base_dir:str, training_dataset:list, model_name:str, epoc
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
 
-    # Build the FNN model
-    fnn_model = Sequential()
-    fnn_model.add(Dense(64, activation='relu', input_dim=X_scaled.shape[1]))
-    fnn_model.add(Dense(32, activation='relu'))
-    fnn_model.add(Dense(len(class_labels.unique()), activation='softmax'))
+    # Fit the imputer used to fill missing pixels at prediction time
+    imputer = SimpleImputer(strategy='mean')
+    imputer.fit(X)
+
+    # Train in mixed precision on GPUs, the softmax output is kept in float32 for numerical stability. The global
+    # policy is restored afterwards so it does not leak into the export or any later Keras use in the process
+    previous_policy = mixed_precision.global_policy()
+    try:
+        if tf.config.list_physical_devices('GPU'):
+            mixed_precision.set_global_policy('mixed_float16')
 
-    # Compile the model
-    fnn_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        # Build the FNN model
+        fnn_model = Sequential()
+        fnn_model.add(Dense(64, activation='relu', input_dim=X_scaled.shape[1]))
+        fnn_model.add(Dense(32, activation='relu'))
+        fnn_model.add(Dense(len(class_labels.unique()), activation='softmax', dtype='float32'))
 
-    # Print the learning rate
-    print("Learning rate:", fnn_model.optimizer.learning_rate.numpy())
+        # Compile the model
+        fnn_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
 
-    # Train the FNN model
-    history = fnn_model.fit(X_scaled, to_categorical(y), epochs=epochs, batch_size=batch_size,
-                            validation_split=validation_split)
+        # Print the learning rate
+        print("Learning rate:", fnn_model.optimizer.learning_rate.numpy())
+
+        # Hold out the last rows for validation, as Keras' validation_split does, and stream both sets with tf.data
+        X_scaled = X_scaled.astype(np.float32)
+        y_categorical = to_categorical(y)
+        split = len(X_scaled) - int(len(X_scaled) * validation_split)
+        train_dataset = (tf.data.Dataset.from_tensor_slices((X_scaled[:split], y_categorical[:split]))
+                         .shuffle(min(split, 100_000)).batch(batch_size).prefetch(tf.data.AUTOTUNE))
+        validation_dataset = None
+        if split < len(X_scaled):
+            validation_dataset = (tf.data.Dataset.from_tensor_slices((X_scaled[split:], y_categorical[split:]))
+                                  .batch(batch_size).prefetch(tf.data.AUTOTUNE))
+
+        # Train the FNN model
+        history = fnn_model.fit(train_dataset, epochs=epochs, validation_data=validation_dataset)
+    finally:
+        mixed_precision.set_global_policy(previous_policy)
 
     # Define the output directories for the model and classified image
     output_model_dir = os.path.join(base_dir, 'results', 'classified_model')
@@ -65,80 +115,292 @@ def training_fnn_model(base_dir:str, training_dataset:list, model_name:str, epoc
     model_file_path = os.path.join(output_model_dir, model_name)
     fnn_model.save(model_file_path)
 
+    # Save the training statistics next to the model so predictions use the same transformation
+    joblib.dump((scaler.mean_, scaler.scale_, imputer.statistics_), _scaler_path(model_file_path))
+
+    # Export the model to ONNX so predictions can run on ONNX Runtime instead of Keras
+    if tf2onnx is not None:
+        input_signature = (tf.TensorSpec((None, X_scaled.shape[1]), tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(fnn_model, input_signature=input_signature, output_path=_onnx_path(model_file_path))
+
+        # Quantize the Dense weights to int8 for faster inference
+        if onnxruntime is not None:
+            quantize_dynamic(_onnx_path(model_file_path), _onnx_path(model_file_path, quantized=True),
+                             weight_type=QuantType.QInt8)
+
     return model_file_path
 
 
-def predicting_image(base_dir, saved_model):
+def convert_training_dataset(training_dataset:str)->str:
     """
-    Load the FNN model, make predictions, and save the classified image.
+    Convert a training dataset in Excel format to Parquet, saved next to the original file.
 
     Parameters:
-    - model_file_path (str): Path to the trained FNN model file.
-    - feature_layers (list): List of loaded raster layers.
-    - scaler (StandardScaler): StandardScaler object used for scaling the data.
-    - imputer (SimpleImputer): SimpleImputer object used for imputing missing values.
-    - band_profile (dict): Profile information of the raster layers.
-    - dataset (str): Path to the training dataset in Excel format.
-    - image_output_dir (str): Directory to save the classified image.
+    - training_dataset (str): Path to the training dataset in Excel format.
 
     Returns:
-    None
+    - str: Path to the training dataset in Parquet format.
     """
-    # Define the list of raster layers
-    image_feature = glob.glob(os.path.join(base_dir, '**', 'inputdata', '**', '*.tif'), recursive=True)
-    feature_layers, band_profile = _load_layers(image_feature)
-    # Stack the feature layers using np.stack
-    stacked_features = np.stack(feature_layers)
+    parquet_path = f'{os.path.splitext(training_dataset)[0]}.parquet'
+    pd.read_excel(training_dataset).to_parquet(parquet_path, index=False)
+    return parquet_path
 
-    imputer = SimpleImputer(strategy='mean')
 
-    # Reshape the data to be 2D
-    data_reshaped = stacked_features.transpose(1, 2, 0).reshape(-1, stacked_features.shape[0])
-    imputer.fit(data_reshaped)
-    data_reshaped = imputer.transform(data_reshaped)
-    scaler = StandardScaler()
-    scaler.fit(data_reshaped)
-    data_reshaped = scaler.transform(data_reshaped)
+def predicting_image(base_dir, saved_model, tile_size=1024, max_workers=None, engine=None):
+    """
+    Load the FNN model, make predictions tile by tile, and save the classified image.
 
-    # Load the FNN model
-    loaded_model = load_model(saved_model)
+    Parameters:
+    - base_dir (str): Base directory path.
+    - saved_model (str): Path to the trained FNN model file.
+    - tile_size (int): Width and height of the windows used to stream the raster layers.
+    - max_workers (int): Number of threads reading and classifying tiles. Defaults to the number of CPUs, at most 4.
+    - engine (str): Inference engine, 'numba', 'onnx' or 'keras'. Defaults to the fastest one available.
 
-    # Make predictions using the loaded FNN model
-    predictions = loaded_model.predict(data_reshaped)
+    Returns:
+    None
+    """
+    # Define the list of raster layers
+    image_feature = glob.glob(os.path.join(base_dir, '**', 'inputdata', '**', '*.tif'), recursive=True)
+    # Every worker opens its own handle on every layer, so the default is capped to keep the open files bounded
+    max_workers = max_workers or min(4, os.cpu_count())
 
-    # Convert predictions to class labels for multi-class classification
-    class_labels = np.argmax(predictions, axis=1)
+    # Load the FNN model and the statistics saved at training time
+    predict_tile = _load_predictor(saved_model, engine)
 
-    # Reshape the class labels back to the original raster shape
-    class_labels_reshaped = class_labels.reshape(stacked_features.shape[1:])
     output_image_dir = os.path.join(base_dir, 'results', 'classified_images')
     # Save the classified image with the name of the Excel file
     os.makedirs(output_image_dir, exist_ok=True)
     output_path_fnn = os.path.join(output_image_dir, f'{os.path.splitext(os.path.basename(saved_model))[0]}_classified.tif')
 
-    # Write the classified image to a GeoTIFF file
-    with rasterio.open(output_path_fnn, 'w', **band_profile) as dst:
-        dst.write(class_labels_reshaped, 1)
+    def classify_window(window):
+        feature_tile = _load_layers(feature_readers(), window)
+        return window, predict_tile(feature_tile)
+
+    with rasterio.open(image_feature[-1]) as src:
+        band_profile = src.profile
+
+    # Class labels fit in a byte and compress very well with tiling, the horizontal predictor and parallel LZW
+    output_profile = band_profile.copy()
+    output_profile.update(count=1, dtype='uint8', nodata=None, compress='lzw', predictor=2, tiled=True,
+                          blockxsize=512, blockysize=512, num_threads='ALL_CPUS', BIGTIFF='IF_SAFER')
+
+    # Workers read and classify tiles with their own readers, while this thread is the single writer of the classified
+    # image
+    with thread_local_readers(image_feature) as feature_readers, \
+            rasterio.open(output_path_fnn, 'w', **output_profile) as dst, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for window in tile_windows(band_profile['width'], band_profile['height'], tile_size):
+            pending.add(executor.submit(classify_window, window))
+            # Bound the number of tiles in flight to keep memory constant
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window, class_labels = future.result()
+                    dst.write(class_labels, 1, window=window)
+        for future in as_completed(pending):
+            window, class_labels = future.result()
+            dst.write(class_labels, 1, window=window)
+
+
+def _load_layers(feature_srcs, window):
+    """
+    Load a window of the raster layers.
+
+    Every band of a multi-band layer is a feature, in the same order as the columns of the training samples.
+
+    Parameters:
+    - feature_srcs (list): List of open raster layers.
+    - window (rasterio.windows.Window): Window to read from every layer.
+
+    Returns:
+    - numpy.ndarray: Stacked float32 window of the raster layers with shape (bands, height, width).
+    """
+    # Read every layer in place into a single preallocated array instead of stacking a list of arrays
+    feature_tile = np.empty((sum(src.count for src in feature_srcs), window.height, window.width), dtype=np.float32)
+    band = 0
+    for src in feature_srcs:
+        src.read(window=window, out=feature_tile[band:band + src.count])
+        band += src.count
+    return feature_tile
+
+
+def _predict_tile(feature_tile, predict, mean, scale, statistics):
+    """
+    Classify a window of the stacked raster layers.
+
+    Parameters:
+    - feature_tile (numpy.ndarray): Stacked raster layers with shape (bands, height, width).
+    - predict (callable): Function returning the class probabilities of a 2D float32 array.
+    - mean (numpy.ndarray): Per-feature mean of the training data.
+    - scale (numpy.ndarray): Per-feature standard deviation of the training data.
+    - statistics (numpy.ndarray): Per-feature values used to fill missing pixels.
+
+    Returns:
+    - numpy.ndarray: Class labels with shape (height, width).
+    """
+    # Reshape the data to be 2D, one float32 row per pixel
+    data_reshaped = np.ascontiguousarray(feature_tile.reshape(feature_tile.shape[0], -1).T, dtype=np.float32)
+
+    # Impute and standardize in place
+    np.copyto(data_reshaped, statistics.astype(np.float32), where=np.isnan(data_reshaped))
+    np.subtract(data_reshaped, mean.astype(np.float32), out=data_reshaped)
+    np.divide(data_reshaped, scale.astype(np.float32), out=data_reshaped)
+
+    # Convert predictions to class labels for multi-class classification
+    predictions = predict(data_reshaped)
+    return np.argmax(predictions, axis=1).astype(np.uint8).reshape(feature_tile.shape[1:])
+
+
+def _load_predictor(saved_model, engine=None):
+    """
+    Load the trained FNN model and its training statistics as a tile classification function.
+
+    Parameters:
+    - saved_model (str): Path to the trained FNN model file.
+    - engine (str): Inference engine. 'numba' runs imputation, standardization and the network in one fused kernel,
+      'onnx' runs the ONNX export on ONNX Runtime preferring its int8 quantized version, and 'keras' uses the Keras
+      model. Defaults to the first one available in that order.
+
+    Returns:
+    - callable: Function returning the class labels of a stacked tile with shape (bands, height, width).
+    """
+    mean, scale, statistics = (stat.astype(np.float32) for stat in joblib.load(_scaler_path(saved_model)))
+    onnx_path = _onnx_path(saved_model, quantized=True)
+    if not os.path.exists(onnx_path):
+        onnx_path = _onnx_path(saved_model)
+
+    if engine is None:
+        if numba is not None:
+            engine = 'numba'
+        elif onnxruntime is not None and os.path.exists(onnx_path):
+            engine = 'onnx'
+        else:
+            engine = 'keras'
+
+    if engine == 'numba':
+        if numba is None:
+            raise ImportError("engine='numba' requires numba")
+        weights = [weight.astype(np.float32) for weight in load_model(saved_model).get_weights()]
+        return lambda feature_tile: _predict_tile_fused(feature_tile, mean, scale, statistics, weights)
+
+    if engine == 'onnx':
+        if onnxruntime is None:
+            raise ImportError("engine='onnx' requires onnxruntime")
+        session = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+
+        def predict(data):
+            return np.concatenate([session.run(None, {input_name: data[i:i + PREDICT_BATCH_SIZE]})[0]
+                                   for i in range(0, len(data), PREDICT_BATCH_SIZE)])
+    elif engine == 'keras':
+        loaded_model = load_model(saved_model)
+
+        def predict(data):
+            return loaded_model.predict(data, batch_size=PREDICT_BATCH_SIZE, verbose=0)
+    else:
+        raise ValueError(f"Unknown inference engine: {engine}")
+
+    return lambda feature_tile: _predict_tile(feature_tile, predict, mean, scale, statistics)
 
 
+def _predict_tile_fused(feature_tile, mean, scale, statistics, weights):
+    """
+    Classify a window of the stacked raster layers with the fused Numba kernel.
+
+    Parameters:
+    - feature_tile (numpy.ndarray): Stacked raster layers with shape (bands, height, width).
+    - mean (numpy.ndarray): Per-feature mean of the training data.
+    - scale (numpy.ndarray): Per-feature standard deviation of the training data.
+    - statistics (numpy.ndarray): Per-feature values used to fill missing pixels.
+    - weights (list): Kernels and biases of the three Dense layers of the FNN model.
+
+    Returns:
+    - numpy.ndarray: Class labels with shape (height, width).
+    """
+    data = np.ascontiguousarray(feature_tile.reshape(feature_tile.shape[0], -1), dtype=np.float32)
+    class_labels = np.empty(data.shape[1], dtype=np.uint8)
+    # The default Numba threading layer does not support launching parallel kernels from several threads at once. The
+    # kernel already uses every core, the worker threads overlap it with reading and decoding the next tiles
+    with _FUSED_KERNEL_LOCK:
+        _fused_fnn_kernel(data, mean, scale, statistics, *weights, class_labels)
+    return class_labels.reshape(feature_tile.shape[1:])
+
+
+_FUSED_KERNEL_LOCK = threading.Lock()
+
+if numba is not None:
+    # NaN-aware fastmath flags, 'nnan' would let LLVM drop the missing pixel check
+    @numba.njit(parallel=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, cache=True)
+    def _fused_fnn_kernel(data, mean, scale, statistics, w1, b1, w2, b2, w3, b3, class_labels):
+        """
+        Impute, standardize, run the Dense(ReLU) -> Dense(ReLU) -> Dense network and take the argmax in one pass.
+
+        Parameters:
+        - data (numpy.ndarray): Raster values with shape (bands, pixels).
+        - mean, scale, statistics (numpy.ndarray): Per-feature training statistics.
+        - w1, b1, w2, b2, w3, b3 (numpy.ndarray): Kernels and biases of the Dense layers.
+        - class_labels (numpy.ndarray): Output class label of each pixel.
+        """
+        n_features, n_pixels = data.shape
+        chunk_size = 4096
+        for chunk in numba.prange((n_pixels + chunk_size - 1) // chunk_size):
+            features = np.empty(n_features, dtype=np.float32)
+            hidden1 = np.empty(w1.shape[1], dtype=np.float32)
+            hidden2 = np.empty(w2.shape[1], dtype=np.float32)
+            for pixel in range(chunk * chunk_size, min((chunk + 1) * chunk_size, n_pixels)):
+                for f in range(n_features):
+                    value = data[f, pixel]
+                    if np.isnan(value):
+                        value = statistics[f]
+                    features[f] = (value - mean[f]) / scale[f]
+                for j in range(w1.shape[1]):
+                    acc = b1[j]
+                    for f in range(n_features):
+                        acc += features[f] * w1[f, j]
+                    hidden1[j] = max(acc, 0.0)
+                for j in range(w2.shape[1]):
+                    acc = b2[j]
+                    for f in range(w1.shape[1]):
+                        acc += hidden1[f] * w2[f, j]
+                    hidden2[j] = max(acc, 0.0)
+                # Softmax is monotonic, so the argmax of the logits is the predicted class
+                best_class = 0
+                best_logit = -np.inf
+                for j in range(w3.shape[1]):
+                    acc = b3[j]
+                    for f in range(w2.shape[1]):
+                        acc += hidden2[f] * w3[f, j]
+                    if acc > best_logit:
+                        best_logit = acc
+                        best_class = j
+                class_labels[pixel] = best_class
+
 
-def _load_layers(feature_paths):
+def _scaler_path(model_file_path):
     """
-    Load raster layers from given paths.
+    Build the path of the file storing the training statistics of a saved model.
 
     Parameters:
-    - feature_paths (list): List of paths to raster layers.
+    - model_file_path (str): Path to the trained FNN model file.
 
     Returns:
-    - feature_layers (list): List of loaded raster layers.
-    - band_profile (dict): Profile information of the raster layers.
-    """
-    feature_layers = []
-    for feature_path in feature_paths:
-        print(feature_path)
-        with rasterio.open(feature_path) as src:
-            feature_layer = src.read(1)
-            band_profile = src.profile
-            feature_layers.append(feature_layer)
-    return feature_layers, band_profile
+    - str: Path to the joblib file with the scaler mean, scale and imputer statistics.
+    """
+    return f'{os.path.splitext(model_file_path)[0]}_scaler.joblib'
+
+
+def _onnx_path(model_file_path, quantized=False):
+    """
+    Build the path of the ONNX export of a saved model.
 
+    Parameters:
+    - model_file_path (str): Path to the trained FNN model file.
+    - quantized (bool): Whether to build the path of the int8 quantized export.
+
+    Returns:
+    - str: Path to the ONNX model file.
+    """
+    suffix = '.int8.onnx' if quantized else '.onnx'
+    return f'{os.path.splitext(model_file_path)[0]}{suffix}'
@@ -1,4 +1,3 @@
-import geopandas as gpd
 import rasterio
 import os
 import pandas as pd
@@ -6,6 +5,7 @@ import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 import glob
+from cropclassification.sampling_techniques.sampling_utils import read_points
 from sklearn.metrics import precision_recall_fscore_support
 from sklearn.metrics import confusion_matrix
 
@@ -27,7 +27,7 @@ def evaluation_metrics(base_dir, samples_points:str, predicted_img:str, metrics_
     Main function to perform the classification evaluation and visualization.
 
     Parameters:
-    - samples_points (str): Path to the point samples shapefile.
+    - samples_points (str): Path to the point samples, as a shapefile, FlatGeobuf or GeoParquet.
     - predicted_img (str): Path to the classified image.
     - path_save_metrics_excel (str): Path to save the metrics Excel file.
     - path_confusin_matrix (str): Path to save the confusion matrix plot.
@@ -49,7 +49,7 @@ def evaluation_metrics(base_dir, samples_points:str, predicted_img:str, metrics_
     path_confusin_matrix = os.path.join(confusion_matrix_path, confusin_matrix_output)
 
     # Read points
-    gdf = gpd.read_file(samples_points)
+    gdf = read_points(samples_points)
 
     class_counts = gdf['value'].value_counts()
 
@@ -66,9 +66,6 @@ def evaluation_metrics(base_dir, samples_points:str, predicted_img:str, metrics_
     # Convert the GeoDataFrame to a regular DataFrame
     result_df = result_df.drop(columns='geometry')
 
-    # Apply a lambda function to convert values to regular numbers
-    result_df = result_df.applymap(lambda x: x[0] if isinstance(x, (list, np.ndarray)) else x)
-
     # Assuming the first column is observed data and the second column is predicted values
     observed_data = result_df.iloc[:, 0]
     predicted_data = result_df.iloc[:, 1]
@@ -103,26 +100,18 @@ def _extract_raster_values_to_dataframe(img_paths, gdf):
     """
     result_df = gdf.copy()
 
+    # Collect the coordinates of all points once
+    coords = np.asarray([(point.x, point.y) for point in gdf.geometry.values])
+
     for raster_path in img_paths:
         print(raster_path)
         with rasterio.open(raster_path) as src:
-            values_list = []
-
-            for index, row in gdf.iterrows():
-                # Get the geometry of the point
-                point_geometry = row['geometry']
-
-                # Extract the values from the raster for the point
-                try:
-                    values = list(src.sample([point_geometry.coords[0]]))
-                    values_list.append(values)
-                except Exception as e:
-                    print(f"Error extracting values for Point {index} from {raster_path} - Error: {e}")
+            # Extract the values from the raster for all points in a single call
+            values = np.fromiter((value[0] for value in src.sample(coords)), dtype=src.dtypes[0],
+                                 count=len(coords))
 
             # Create a DataFrame with the values for the current raster layer
-            raster_df = pd.DataFrame(values_list,
-                                     columns=[f"Raster_{os.path.basename(raster_path)}_{i}" for i in
-                                              range(len(values_list[0]))])
+            raster_df = pd.DataFrame({f"Raster_{os.path.basename(raster_path)}_0": values}, index=gdf.index)
 
             # Concatenate the new DataFrame to the result_df
             result_df = pd.concat([result_df, raster_df], axis=1)
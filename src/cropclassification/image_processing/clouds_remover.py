@@ -35,7 +35,10 @@ def process_hls_images(base_dir: str, scaler_factor=10000) -> None:
                                          f'{img_dates}_{img_product}_{tile}_Fmask.tif')
 
         with rasterio.open(cloud_mask_images) as src:
-            cloud_mask = src.read(1)
+            cloud_mask = src.read(1) == 1
+
+        # Reuse a single float32 buffer for all the bands of the scene
+        band_data = None
 
         bands_to_process = bands_per_product.get(img_product, set())
         for band_name in bands_to_process:
@@ -45,24 +48,20 @@ def process_hls_images(base_dir: str, scaler_factor=10000) -> None:
             if not os.path.exists(file_band):
                 continue  # Skip if the band file doesn't exist
 
-            # Load the band
+            # Load the band straight into the float32 buffer
             with rasterio.open(file_band) as band_src:
-                band_data = band_src.read(1) / float(scaler_factor)
+                if band_data is None or band_data.shape != band_src.shape:
+                    band_data = np.empty(band_src.shape, dtype=np.float32)
+                band_src.read(1, out=band_data)
                 src_profile = band_src.profile
 
-            # Replace values outside the range [0, 1] with np.nan
-            band_data[(band_data > 1) | (band_data < 0)] = np.nan
-
-            # Apply the cloud mask to the band
-            band_data = np.where(cloud_mask == 1, np.nan, band_data)
+            # Replace clouds and values outside the range [0, scaler_factor] with np.nan, then scale in place
+            invalid = cloud_mask | (band_data > scaler_factor) | (band_data < 0)
+            np.divide(band_data, scaler_factor, out=band_data)
+            np.copyto(band_data, np.nan, where=invalid)
 
             output_path = os.path.join(dir_output_date, os.path.basename(file_band))
-            src_profile['nodata'] = np.nan
-            src_profile['dtype'] = 'float32'
-            src_profile['compress'] = 'lzw'
+            src_profile.update(nodata=np.nan, dtype='float32', compress='lzw', predictor=3, tiled=True,
+                               blockxsize=512, blockysize=512, num_threads='ALL_CPUS')
             with rasterio.open(output_path, 'w', **src_profile) as dst:
-                dst.write(band_data.astype(rasterio.float32), 1)
-
-
-
-
+                dst.write(band_data, 1)
@@ -3,6 +3,7 @@ import os
 import glob
 from datetime import datetime, timedelta
 import rasterio
+import rasterio.shutil
 
 
 def organize_hls(hls_raw_images: str, base_dir: str, tile_dir: str, start_date: str, end_date: str) -> None:
@@ -63,23 +64,32 @@ def organize_hls(hls_raw_images: str, base_dir: str, tile_dir: str, start_date:
                 dir_output_date = os.path.join(dir_output, metadata['date_string'])
                 os.makedirs(dir_output_date, exist_ok=True)
 
-                with rasterio.open(file_path) as src:
-                    band_data = src.read(1)
-                    src_profile = src.profile
-
-                src_profile['crs'] = target_crs
-
                 if band_name == 'Fmask':
-                    src_profile['dtype'] = 'uint8'
+                    dtype = 'uint8'
                 else:
-                    src_profile['dtype'] = 'uint16'
+                    dtype = 'uint16'
 
                 hls_output_path = os.path.join(dir_output_date, hls_renamed)
-                src_profile['nodata'] = 0
-                src_profile['compress'] = 'lzw'
 
-                with rasterio.open(hls_output_path, 'w', **src_profile) as dst:
-                    dst.write(band_data, 1)
+                with rasterio.open(file_path) as src:
+                    src_profile = src.profile
+                    # Only read the pixels when they have to be cast to the output data type
+                    band_data = src.read(1) if src_profile['dtype'] != dtype else None
+
+                if band_data is None:
+                    # Only the metadata changes, so let GDAL stream the pixels block by block
+                    rasterio.shutil.copy(file_path, hls_output_path, driver='GTiff', compress='lzw', tiled=True)
+                    with rasterio.open(hls_output_path, 'r+') as dst:
+                        dst.crs = target_crs
+                        dst.nodata = 0
+                else:
+                    src_profile['crs'] = target_crs
+                    src_profile['dtype'] = dtype
+                    src_profile['nodata'] = 0
+                    src_profile['compress'] = 'lzw'
+
+                    with rasterio.open(hls_output_path, 'w', **src_profile) as dst:
+                        dst.write(band_data, 1)
 
 
 ### Privite Functions ###
@@ -127,19 +137,18 @@ def _extract_metadata_from_path(file_path: str) -> Dict[str, str]:
 
 def _get_valid_crs(hls_images_paths) -> str:
     """
-        Find and return the valid UTM CRS among a list of HLS image paths.
+    Find and return the valid UTM CRS among a list of HLS image paths.
 
-        Args:
-            hls_images_paths (List[str]): List of paths to HLS images.
+    HLS images of a tile share a single CRS, so only the first image is opened unless its CRS is not a valid UTM one.
 
-        Returns:
-            str: Valid UTM CRS in the format 'EPSG:xxxx' if found, otherwise an empty string.
-        """
+    Args:
+        hls_images_paths (List[str]): Paths to HLS images.
+
+    Returns:
+        str: Valid UTM CRS in the format 'EPSG:xxxx' if found, otherwise an empty string.
+    """
     for path in hls_images_paths:
         with rasterio.open(path) as src:
             crs = src.crs
         if _is_valid_utm_crs(crs):
             return crs
-
-
-
@@ -0,0 +1,51 @@
+import threading
+import rasterio
+from contextlib import contextmanager
+from rasterio.windows import Window
+
+
+def tile_windows(width, height, tile_size):
+    """
+    Splits a raster into square windows.
+
+    Args:
+    - width (int): Width of the raster.
+    - height (int): Height of the raster.
+    - tile_size (int): Width and height of the windows.
+
+    Returns:
+    - generator: Windows covering the whole raster, the last row and column clipped to its bounds.
+    """
+    for row_off in range(0, height, tile_size):
+        for col_off in range(0, width, tile_size):
+            yield Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+
+
+@contextmanager
+def thread_local_readers(paths):
+    """
+    Lazily opens unshared readers of raster images for every thread, a GDAL handle must not be used by two threads.
+
+    Args:
+    - paths (list of str): List of paths to raster images.
+
+    Returns:
+    - callable: Function returning the open readers of the calling thread, in the order of paths. They are all closed
+      when the context exits.
+    """
+    thread_data = threading.local()
+    opened_srcs = []
+    opened_lock = threading.Lock()
+
+    def get_readers():
+        if not hasattr(thread_data, 'srcs'):
+            thread_data.srcs = [rasterio.open(path, sharing=False) for path in paths]
+            with opened_lock:
+                opened_srcs.extend(thread_data.srcs)
+        return thread_data.srcs
+
+    try:
+        yield get_readers
+    finally:
+        for src in opened_srcs:
+            src.close()
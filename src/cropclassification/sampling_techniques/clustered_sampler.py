@@ -2,10 +2,16 @@ import os
 import numpy as np
 import geopandas as gpd
 from shapely.geometry import Point
-from rasterio.transform import xy
 import pandas as pd
 import rasterio
 from sklearn.cluster import DBSCAN
+from cropclassification.sampling_techniques.sampling_utils import pixel_centers
+
+try:
+    import cupy as cp
+    from cuml.cluster import DBSCAN as cuDBSCAN
+except ImportError:
+    cuDBSCAN = None
 
 
 def clustered_sampling(crop_types, base_dir, samples_per_class, min_pixels, eps, min_samples, min_cluster_size, min_density, output):
@@ -41,26 +47,31 @@ def clustered_sampling(crop_types, base_dir, samples_per_class, min_pixels, eps,
 
         for class_value, target_samples in samples_per_class.items():
             if class_value >= 0:
-                indices = np.where(raster_data == class_value)
+                rows, cols = np.where(raster_data == class_value)
 
-                if len(indices[0]) >= min_pixels:
+                if len(rows) >= min_pixels:
                     buffer_size = 10
-                    coordinates = [xy(transform, i, j) for i, j in zip(indices[0], indices[1]) if
-                                   buffer_size < i < src.width - buffer_size and buffer_size < j < src.height - buffer_size]
+                    # Keep only the pixels away from the raster borders, rows against the height and columns against the width
+                    height, width = raster_data.shape
+                    inside = ((buffer_size < rows) & (rows < height - buffer_size) &
+                              (buffer_size < cols) & (cols < width - buffer_size))
+                    rows, cols = rows[inside], cols[inside]
+
+                    coordinates = pixel_centers(transform, rows, cols)
 
-                    clustering = DBSCAN(eps=eps, min_samples=min_samples).fit(coordinates)
-                    unique_labels, cluster_sizes = np.unique(clustering.labels_, return_counts=True)
+                    cluster_labels = _dbscan_labels(coordinates, eps, min_samples)
+                    unique_labels, cluster_sizes = np.unique(cluster_labels, return_counts=True)
 
                     for label, size in zip(unique_labels, cluster_sizes):
                         if size >= min_cluster_size:
-                            cluster_indices = np.where(clustering.labels_ == label)[0]
+                            cluster_indices = np.where(cluster_labels == label)[0]
                             cluster_density = size / len(coordinates)
 
                             if cluster_density >= min_density:
                                 sampled_indices = np.random.choice(
                                     len(cluster_indices), min(target_samples, len(cluster_indices)), replace=False
                                 )
-                                sampled_coordinates = [coordinates[i] for i in cluster_indices[sampled_indices]]
+                                sampled_coordinates = coordinates[cluster_indices[sampled_indices]]
 
                                 class_count[class_value] = len(sampled_coordinates)
                                 value_list = [class_value] * len(sampled_coordinates)
@@ -75,3 +86,22 @@ def clustered_sampling(crop_types, base_dir, samples_per_class, min_pixels, eps,
     return gdf
 
 
+### Private functions ###
+def _dbscan_labels(coordinates, eps, min_samples):
+    """
+    Cluster coordinates with DBSCAN, on the GPU with cuML when it is installed.
+
+    Parameters:
+        coordinates (numpy.ndarray): Array of shape (n, 2) with the (x, y) coordinates.
+        eps (float): Maximum distance between two samples for one to be considered as in the neighborhood of the other.
+        min_samples (int): Number of samples in a neighborhood for a point to be considered as a core point.
+
+    Returns:
+        numpy.ndarray: Cluster label of each coordinate, -1 for noise.
+    """
+    if cuDBSCAN is not None:
+        clustering = cuDBSCAN(eps=eps, min_samples=min_samples).fit(cp.asarray(coordinates, dtype=cp.float64))
+        return cp.asnumpy(clustering.labels_)
+
+    clustering = DBSCAN(eps=eps, min_samples=min_samples, n_jobs=-1).fit(coordinates)
+    return clustering.labels_
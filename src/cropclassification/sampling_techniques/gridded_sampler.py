@@ -1,10 +1,10 @@
 import os
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
 from rasterio.transform import xy
 import pandas as pd
 import rasterio
+from cropclassification.sampling_techniques.sampling_utils import export_points, sample_raster
 
 
 def gridded_sampling(output_dir, image_path, total_points, output_name, buffer_size=10):
@@ -13,7 +13,7 @@ def gridded_sampling(output_dir, image_path, total_points, output_name, buffer_s
     samples_points_dir = os.path.join(output_dir, 'results', 'sample_points', 'gridded_sampling')
     os.makedirs(samples_points_dir, exist_ok=True)
 
-    # Full path for the output shapefile
+    # Full path for the output file, GeoParquet for '.parquet' names
     output_shapefile = os.path.join(samples_points_dir, os.path.basename(output_name))
 
     gdf_list = []
@@ -32,24 +32,24 @@ def gridded_sampling(output_dir, image_path, total_points, output_name, buffer_s
         x = np.linspace(xmin, xmax, grid_size)
         y = np.linspace(ymin, ymax, grid_size)
 
-        grid_points = np.array(np.meshgrid(x, y)).T.reshape(-1, 2)
+        # Build only the first total_points grid points, x varying slowest, without materializing a full meshgrid
+        x_index, y_index = np.divmod(np.arange(min(total_points, grid_size * grid_size)), grid_size)
+        grid_points = np.empty((len(x_index), 2))
+        grid_points[:, 0] = x[x_index]
+        grid_points[:, 1] = y[y_index]
 
-        # Trim the excess points to meet the target total
-        grid_points = grid_points[:total_points]
-
-        # Read raster values for each grid point
-        values = list(src.sample(grid_points))
-        value_list = [val[0] for val in values]
+        # Read raster values for each grid point, block by block
+        value_list = sample_raster(src, grid_points)[:, 0]
 
         gdf_list.append(
             gpd.GeoDataFrame(
-                {'geometry': [Point(coord) for coord in grid_points], 'value': value_list}, crs=crs
+                {'geometry': gpd.points_from_xy(grid_points[:, 0], grid_points[:, 1]), 'value': value_list}, crs=crs
             )
         )
 
     # Export the sample points
     gdf = gpd.GeoDataFrame(pd.concat(gdf_list, ignore_index=True), crs=gdf_list[0].crs)
-    gdf.to_file(output_shapefile)
+    export_points(gdf, output_shapefile)
 
 
 
@@ -2,11 +2,12 @@ import os
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
 import rasterio
+from cropclassification.sampling_techniques.sampling_utils import export_points, sample_raster
 
 
-def randon_sampling(num_points:int, output_dir:str, buffer_size:float, crop_types_path:str, output_name:str)-> None:
+def random_sampling(num_points:int, output_dir:str, buffer_size:float, crop_types_path:str, output_name:str,
+                    seed=None)-> None:
     """
     Generate random points within a buffer around the edges of a raster, assigning each point a class ID based on the raster values.
 
@@ -14,7 +15,8 @@ def randon_sampling(num_points:int, output_dir:str, buffer_size:float, crop_type
     - num_points (int): Number of random points to generate.
     - buffer_size (float): Size of the buffer around the edges of the raster.
     - crop_types_path (str): Path to the raster file containing crop types.
-    - output_shapefile (str): Path to the output shapefile to save the generated points.
+    - output_name (str): Name of the output file, GeoParquet for '.parquet' names.
+    - seed (int, optional): Seed of the random generator, for reproducible samples. Default is None.
 
     Returns:
     - None
@@ -24,28 +26,24 @@ def randon_sampling(num_points:int, output_dir:str, buffer_size:float, crop_type
     os.makedirs(samples_points_dir, exist_ok=True)
     # Generate random points with a buffer around the edges and assign class ID
     output_shapefile = os.path.join(samples_points_dir, output_name)
-    # Open the crop_types raster to get its bounding box
-    with rasterio.open(crop_types_path) as raster:
-        raster_bounds = raster.bounds
 
-    xmin, ymin, xmax, ymax = raster_bounds
-    inner_xmin, inner_ymin, inner_xmax, inner_ymax = xmin + buffer_size, ymin + buffer_size, xmax - buffer_size, ymax - buffer_size
-    random_coordinates = np.column_stack((np.random.uniform(inner_xmin, inner_xmax, num_points),
-                                          np.random.uniform(inner_ymin, inner_ymax, num_points)))
+    rng = np.random.default_rng(seed)
 
-    # Open the crop_types raster to get the class IDs
+    # Open the crop_types raster to get its bounding box and the class IDs
     with rasterio.open(crop_types_path) as crop_raster:
-        crop_type_values = list(crop_raster.sample(random_coordinates))
-
-    # Create a GeoDataFrame for the random points with class ID
-    gdf = gpd.GeoDataFrame({'geometry': [Point(coord) for coord in random_coordinates],
-                            'class_id': [value[0] for value in crop_type_values]},
-                           crs=crop_raster.crs)
-
-    # Export the GeoDataFrame as a shapefile
-    gdf.to_file(output_shapefile)
-
-
+        xmin, ymin, xmax, ymax = crop_raster.bounds
+        inner_xmin, inner_ymin, inner_xmax, inner_ymax = xmin + buffer_size, ymin + buffer_size, xmax - buffer_size, ymax - buffer_size
+        random_coordinates = np.column_stack((rng.uniform(inner_xmin, inner_xmax, num_points),
+                                              rng.uniform(inner_ymin, inner_ymax, num_points)))
 
+        # Read the class ID of every point, block by block
+        class_ids = sample_raster(crop_raster, random_coordinates)[:, 0]
+        crs = crop_raster.crs
 
+    # Create a GeoDataFrame for the random points with class ID
+    gdf = gpd.GeoDataFrame({'geometry': gpd.points_from_xy(random_coordinates[:, 0], random_coordinates[:, 1]),
+                            'class_id': class_ids},
+                           crs=crs)
 
+    # Export the GeoDataFrame
+    export_points(gdf, output_shapefile)
@@ -1,17 +1,19 @@
-import geopandas as gpd
 import rasterio
 import os
 import glob
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from cropclassification.sampling_techniques.sampling_utils import read_points, sample_raster
 
 def extract_training_samples(base_dir: str, samples_points_dir: str) -> None:
     """
-    Process raster data for each shapefile point and save the results to Excel files.
+    Process raster data for each sample points file and save the results to Parquet files.
 
     Parameters:
     - base_dir (str): Base directory for input data.
-    - samples_points_dir (str): Directory containing the shapefile points.
+    - samples_points_dir (str): Directory containing the sample points, as shapefiles, FlatGeobuf or GeoParquet.
 
     Returns:
     - None
@@ -20,93 +22,73 @@ def extract_training_samples(base_dir: str, samples_points_dir: str) -> None:
     output_dir = os.path.join(base_dir, 'results', 'training_samples')
     os.makedirs(output_dir, exist_ok=True)
 
-    def extract_raster_values_to_dataframe(img_paths, gdf):
-        result_df = gdf.copy()
+    def extract_raster_values_to_dataframe(img_paths, srcs, gdf, executor):
+        # Collect the coordinates of all points once
+        coords = np.column_stack([gdf.geometry.x.values, gdf.geometry.y.values])
 
-        for raster_path in img_paths:
+        def sample_one(raster_path, src):
             print(raster_path)
-            with rasterio.open(raster_path) as src:
-                values_list = []
+            # Extract the values from the raster for all points block by block, shape (points, bands)
+            return sample_raster(src, coords)
 
-                for index, row in gdf.iterrows():
-                    # Get the geometry of the point
-                    point_geometry = row['geometry']
+        # GDAL releases the GIL while reading, so the rasters are sampled concurrently, each by one worker at a time
+        raster_values = list(executor.map(sample_one, img_paths, srcs))
 
-                    # Extract the values from the raster for the point
-                    try:
-                        values = list(src.sample([point_geometry.coords[0]]))
-                        values_list.append(values)
-                    except Exception as e:
-                        print(f"Error extracting values for Point {index} from {raster_path} - Error: {e}")
+        # Create a DataFrame with the values for each raster layer, in the order of img_paths
+        raster_dfs = [pd.DataFrame(values, columns=[f"Raster_{raster_path}_{i}" for i in range(values.shape[1])],
+                                   index=gdf.index)
+                      for raster_path, values in zip(img_paths, raster_values)]
 
-                # Create a DataFrame with the values for the current raster layer
-                raster_df = pd.DataFrame(values_list,
-                                         columns=[f"Raster_{raster_path}_{i}" for i in range(len(values_list[0]))])
-
-                # Concatenate the new DataFrame to the result_df
-                result_df = pd.concat([result_df, raster_df], axis=1)
-
-        return result_df
-
-    def extract_date_from_layer(layer_path):
-        names = []
-        for layer_paths in layer_path:
-            # Extract the file name without extension
-            file_name = os.path.splitext(os.path.basename(layer_paths))[0]
-            names.append(file_name)
-
-        return names
+        # Concatenate all the new DataFrames to the points at once
+        return pd.concat([gdf.copy()] + raster_dfs, axis=1)
 
     # Locate the images
     img_paths = glob.glob(os.path.join(base_dir,'**' ,'inputdata', '**', '*.tif'), recursive=True)
 
-    # Iterate over all shapefiles in the directory
-    for shapefile_path in glob.glob(os.path.join(samples_points_dir,'**' , '*.shp'), recursive=True):
-        # Read shapefile points
-        gdf = gpd.read_file(shapefile_path)
-
-        # Apply function to extract the raster values to point
-        result_df = extract_raster_values_to_dataframe(img_paths, gdf)
-
-        # Convert the GeoDataFrame to a regular DataFrame
-        result_df = result_df.drop(columns='geometry')
-
-        # Apply a lambda function to convert values to regular numbers
-        result_df = result_df.applymap(lambda x: x[0] if isinstance(x, (list, np.ndarray)) else x)
-
-        # Rename columns
-        layer_date = extract_date_from_layer(img_paths)
-
-        layer_date.insert(0, 'class')
-
-        # Check if the combined_list has enough elements to rename columns
-        if len(layer_date) == result_df.shape[1]:
-            # Rename columns using 'combined_list'
-            result_df.columns = layer_date
-
-        # Move the first column to the last position
-        columns = list(result_df.columns)
-        columns.append(columns.pop(0))
-        result_df = result_df[columns]
-
-        # Define the output Excel file path including the shapefile name
-        output_excel_path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(shapefile_path))[0]}.xlsx")
-
-        # Export the DataFrame to an Excel file
-        result_df.to_excel(output_excel_path, index=False)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # Iterate over all sample points files in the directory
+    shapefile_paths = [path for extension in ('shp', 'fgb', 'parquet')
+                       for path in glob.glob(os.path.join(samples_points_dir, '**', f'*.{extension}'), recursive=True)]
+
+    with ExitStack() as stack:
+        # Open every raster once for all the sample points files, so GDAL parses each header and keeps its block
+        # cache once, with a handle of its own per reader
+        srcs = [stack.enter_context(rasterio.open(img_path, sharing=False)) for img_path in img_paths]
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=max(1, min(16, len(img_paths)))))
+
+        # Column names, the class followed by the file name without extension of every image, and the band
+        # description or number of every band of the multi-band images
+        layer_date = ['class']
+        for img_path, src in zip(img_paths, srcs):
+            layer_name = os.path.splitext(os.path.basename(img_path))[0]
+            if src.count == 1:
+                layer_date.append(layer_name)
+            else:
+                layer_date.extend(f"{layer_name}_{description or band}"
+                                  for band, description in enumerate(src.descriptions, start=1))
+
+        for shapefile_path in shapefile_paths:
+            # Read sample points
+            gdf = read_points(shapefile_path)
+
+            # Apply function to extract the raster values to point
+            result_df = extract_raster_values_to_dataframe(img_paths, srcs, gdf, executor)
+
+            # Convert the GeoDataFrame to a regular DataFrame
+            result_df = result_df.drop(columns='geometry')
+
+            # Check if the combined_list has enough elements to rename columns
+            if len(layer_date) == result_df.shape[1]:
+                # Rename columns using 'combined_list'
+                result_df.columns = layer_date
+
+            # Move the first column to the last position
+            columns = list(result_df.columns)
+            columns.append(columns.pop(0))
+            result_df = result_df[columns]
+
+            # Define the output Parquet file path including the sample points file name
+            output_parquet_path = os.path.join(output_dir,
+                                               f"{os.path.splitext(os.path.basename(shapefile_path))[0]}.parquet")
+
+            # Export the DataFrame to a Parquet file, much faster to write and load than Excel
+            result_df.to_parquet(output_parquet_path, index=False)
@@ -1,7 +1,7 @@
 import math
 import rasterio
-from rasterio.plot import reshape_as_image
 import numpy as np
+from cropclassification.sampling_techniques.sampling_utils import count_class_pixels
 
 
 def calculate_sample_sizes(class_populations: list, total_samples:int, min_samples_per_class:int)-> dict:
@@ -85,17 +85,18 @@ def count_samples_per_class(image_path):
         # Read the image bands
         image_bands = src.read()
 
-        # Reshape the image bands to a 2D array
-        image_2d = reshape_as_image(image_bands)
+    if image_bands.shape[0] == 1:
+        # Single band class rasters only need a 1D count of the pixel values
+        unique_values, counts = count_class_pixels(image_bands[0])
+    else:
+        # Flatten the bands to one row per pixel, with a single contiguous copy
+        flat_image = np.ascontiguousarray(image_bands.reshape(image_bands.shape[0], -1).T)
 
-    # Flatten the 2D image array
-    flat_image = image_2d.reshape((-1, image_2d.shape[-1]))
+        # View each pixel as a single structured value, so the unique runs on one 1D array in lexicographic order
+        pixel_dtype = np.dtype([(f'band_{i}', flat_image.dtype) for i in range(flat_image.shape[1])])
 
-    # Convert the flat image array to a list of tuples
-    flat_image_tuples = [tuple(pixel) for pixel in flat_image]
-
-    # Calculate the unique class values and their counts
-    unique_values, counts = np.unique(flat_image_tuples, return_counts=True, axis=0)
+        # Calculate the unique class values and their counts
+        unique_values, counts = np.unique(flat_image.view(pixel_dtype).ravel(), return_counts=True)
 
     # Create a dictionary to store counts for each class
     class_counts_dict = {i: count for i, count in enumerate(counts)}
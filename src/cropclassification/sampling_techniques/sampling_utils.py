@@ -0,0 +1,213 @@
+import numpy as np
+import geopandas as gpd
+from rasterio.transform import rowcol
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def sample_raster(src, coords):
+    """
+    Sample the values of a raster at point coordinates, visiting the points block by block.
+
+    The points are sorted by the raster block that contains them before sampling, so each block of a tiled or
+    compressed raster is decoded once instead of once per point, and the values are returned in the input order.
+
+    Args:
+        src (rasterio.io.DatasetReader): Open raster to sample.
+        coords (numpy.ndarray): Point coordinates with shape (points, 2).
+
+    Returns:
+        numpy.ndarray: Raster values with shape (points, bands).
+    """
+    coords = np.asarray(coords, dtype=float)
+    values = np.empty((len(coords), src.count), dtype=src.dtypes[0])
+    if len(coords) == 0:
+        return values
+
+    # Identify the block of every point
+    rows, cols = rowcol(src.transform, coords[:, 0], coords[:, 1])
+    block_height, block_width = src.block_shapes[0]
+    block_cols = -(-src.width // block_width)
+    block_ids = (np.asarray(rows) // block_height) * block_cols + np.asarray(cols) // block_width
+
+    # Sample in block order and restore the original order of the points
+    order = np.argsort(block_ids, kind='stable')
+    values[order] = np.fromiter(src.sample(coords[order]), dtype=(src.dtypes[0], src.count), count=len(order))
+    return values
+
+
+def pixel_centers(transform, rows, cols):
+    """
+    Apply the affine transform of a raster to the centers of pixels at once.
+
+    Args:
+        transform (affine.Affine): Affine transform of the raster.
+        rows (numpy.ndarray): Pixel rows.
+        cols (numpy.ndarray): Pixel columns.
+
+    Returns:
+        numpy.ndarray: Coordinates of the pixel centers with shape (pixels, 2).
+    """
+    return np.column_stack([
+        transform.a * (cols + 0.5) + transform.b * (rows + 0.5) + transform.c,
+        transform.d * (cols + 0.5) + transform.e * (rows + 0.5) + transform.f,
+    ])
+
+
+def export_points(gdf, output_path):
+    """
+    Export sample points, as GeoParquet for '.parquet' paths and through pyogrio's vectorized writer otherwise.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): Sample points.
+        output_path (str): Output file, the driver is picked from its extension ('.parquet', '.fgb', '.shp', ...).
+    """
+    if output_path.endswith('.parquet'):
+        gdf.to_parquet(output_path)
+    else:
+        gdf.to_file(output_path, engine='pyogrio')
+
+
+def read_points(points_path):
+    """
+    Read sample points exported by export_points.
+
+    Args:
+        points_path (str): Path to a GeoParquet file or any vector file readable by pyogrio.
+
+    Returns:
+        geopandas.GeoDataFrame: Sample points.
+    """
+    if points_path.endswith('.parquet'):
+        return gpd.read_parquet(points_path)
+    return gpd.read_file(points_path, engine='pyogrio')
+
+
+def count_class_pixels(class_band):
+    """
+    Count the pixels of every value of a class raster band.
+
+    Integer bands of up to 16 bits are counted with a multithreaded Numba histogram when Numba is installed, any other
+    band falls back to np.unique.
+
+    Args:
+        class_band (numpy.ndarray): Class raster band with shape (height, width).
+
+    Returns:
+        tuple: The sorted values present in the band and their pixel counts.
+    """
+    if numba is not None and np.issubdtype(class_band.dtype, np.integer) and class_band.dtype.itemsize <= 2 \
+            and class_band.size > 0:
+        # One histogram per thread, over the range of values present in the band instead of the whole data type
+        offset = int(class_band.min())
+        n_chunks = min(class_band.shape[0], numba.get_num_threads())
+        counts = _class_histogram_kernel(class_band, offset, int(class_band.max()) - offset + 1, n_chunks)
+        unique_values = np.flatnonzero(counts)
+        return (unique_values + offset).astype(class_band.dtype), counts[unique_values]
+
+    return np.unique(class_band.ravel(), return_counts=True)
+
+
+def bucket_class_pixels(strip, row_off, row_range, col_range, class_values):
+    """
+    Group the flat pixel indices of a full width raster strip by class, in a single pass over the strip.
+
+    Only the pixels within row_range and col_range are kept. The pixels of each class come out in row-major order and
+    the pixels of class_values[k] are pixel_index[class_starts[k]:class_starts[k + 1]]. Integer strips are scanned
+    with a multithreaded Numba kernel when Numba is installed, otherwise with one NumPy mask per class.
+
+    Args:
+        strip (numpy.ndarray): Full width rows of a class raster band with shape (rows, width).
+        row_off (int): Raster row of the first row of the strip.
+        row_range (tuple): First and past-the-end raster rows to keep.
+        col_range (tuple): First and past-the-end raster columns to keep.
+        class_values (list): Non-negative class values to collect.
+
+    Returns:
+        tuple: Flat raster pixel indices grouped by class, and the start of each class with a final end offset.
+    """
+    width = strip.shape[1]
+    row_start = max(row_range[0] - row_off, 0)
+    row_stop = max(min(row_range[1] - row_off, strip.shape[0]), row_start)
+    col_start = max(col_range[0], 0)
+    col_stop = max(min(col_range[1], width), col_start)
+
+    if numba is not None and np.issubdtype(strip.dtype, np.integer) and len(class_values) > 0:
+        # Map every class value to its position in class_values, -1 for the values that are not collected
+        class_slots = np.full(int(max(class_values)) + 1, -1, dtype=np.int64)
+        class_slots[np.asarray(class_values, dtype=np.int64)] = np.arange(len(class_values))
+        n_chunks = max(1, min(row_stop - row_start, 4 * numba.get_num_threads()))
+        return _bucket_pixels_kernel(strip, row_off, row_start, row_stop, col_start, col_stop, class_slots,
+                                     len(class_values), n_chunks)
+
+    inside = np.zeros(strip.shape, dtype=bool)
+    inside[row_start:row_stop, col_start:col_stop] = True
+    class_pixels = [np.flatnonzero((strip == class_value) & inside) + row_off * width for class_value in class_values]
+    class_starts = np.zeros(len(class_values) + 1, dtype=np.int64)
+    np.cumsum([len(pixels) for pixels in class_pixels], out=class_starts[1:])
+    pixel_index = np.concatenate(class_pixels).astype(np.int64) if class_pixels else np.empty(0, dtype=np.int64)
+    return pixel_index, class_starts
+
+
+### Private functions ###
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _class_histogram_kernel(class_band, offset, n_bins, n_chunks):
+        """
+        Count the pixels of every value of an integer band, one partial histogram per chunk of rows.
+        """
+        n_rows, n_cols = class_band.shape
+        rows_per_chunk = (n_rows + n_chunks - 1) // n_chunks
+        chunk_counts = np.zeros((n_chunks, n_bins), dtype=np.int64)
+
+        for chunk in numba.prange(n_chunks):
+            for row in range(chunk * rows_per_chunk, min((chunk + 1) * rows_per_chunk, n_rows)):
+                for col in range(n_cols):
+                    chunk_counts[chunk, np.int64(class_band[row, col]) - offset] += 1
+
+        return chunk_counts.sum(axis=0)
+
+    @numba.njit(parallel=True, cache=True)
+    def _bucket_pixels_kernel(strip, row_off, row_start, row_stop, col_start, col_stop, class_slots, n_classes,
+                              n_chunks):
+        """
+        Counting sort of the strip pixels by class: count per chunk of rows, then scatter each chunk at its offset.
+        """
+        width = strip.shape[1]
+        n_slots = class_slots.shape[0]
+        rows_per_chunk = (row_stop - row_start + n_chunks - 1) // n_chunks
+        chunk_counts = np.zeros((n_chunks, n_classes), dtype=np.int64)
+
+        for chunk in numba.prange(n_chunks):
+            for row in range(row_start + chunk * rows_per_chunk, min(row_start + (chunk + 1) * rows_per_chunk, row_stop)):
+                for col in range(col_start, col_stop):
+                    value = np.int64(strip[row, col])
+                    if 0 <= value < n_slots and class_slots[value] >= 0:
+                        chunk_counts[chunk, class_slots[value]] += 1
+
+        # Each class is a contiguous run, and within it each chunk follows the previous chunk
+        class_starts = np.zeros(n_classes + 1, dtype=np.int64)
+        chunk_offsets = np.empty((n_chunks, n_classes), dtype=np.int64)
+        total = 0
+        for slot in range(n_classes):
+            class_starts[slot] = total
+            for chunk in range(n_chunks):
+                chunk_offsets[chunk, slot] = total
+                total += chunk_counts[chunk, slot]
+        class_starts[n_classes] = total
+
+        pixel_index = np.empty(total, dtype=np.int64)
+        for chunk in numba.prange(n_chunks):
+            position = chunk_offsets[chunk].copy()
+            for row in range(row_start + chunk * rows_per_chunk, min(row_start + (chunk + 1) * rows_per_chunk, row_stop)):
+                for col in range(col_start, col_stop):
+                    value = np.int64(strip[row, col])
+                    if 0 <= value < n_slots and class_slots[value] >= 0:
+                        slot = class_slots[value]
+                        pixel_index[position[slot]] = (row_off + row) * width + col
+                        position[slot] += 1
+
+        return pixel_index, class_starts
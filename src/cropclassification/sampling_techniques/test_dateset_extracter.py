@@ -1,23 +1,25 @@
 import os
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point
-from rasterio.transform import xy
 import pandas as pd
 import rasterio
+from rasterio.windows import Window
+from cropclassification.sampling_techniques.sampling_utils import bucket_class_pixels, export_points, pixel_centers
 
 
 def test_dataset(image_path: str, base_dir: str, samples_per_class: dict, buffer_size=10,
-                        output_name=None) -> None:
+                        output_name=None, seed=None) -> None:
     """
-    Generates random points within a specified buffer around the edges of each class in a raster image and exports them to shapefiles.
+    Generates random points within a specified buffer around the edges of each class in a raster image and exports them.
 
     Parameters:
     - image_path (str): Path to the raster image file.
     - base_dir (str): Base directory where the output shapefiles will be saved.
     - samples_per_class (dict): Dictionary specifying the number of samples to generate for each class.
     - buffer_size (int, optional): Size of the buffer around the edges of each class. Default is 10.
-    - output_name (str, optional): Name of the output shapefile. If None, a default name will be used.
+    - output_name (str, optional): Name of the output file, GeoParquet for '.parquet' names. If None, a default
+      GeoParquet name will be used.
+    - seed (int, optional): Seed of the random generator, for reproducible samples. Default is None.
     """
     samples_points_dir = os.path.join(base_dir, 'results', 'test_dataset')
     # Create the output directory if it doesn't exist
@@ -25,41 +27,92 @@ def test_dataset(image_path: str, base_dir: str, samples_per_class: dict, buffer
 
     # Set default output name if not provided
     if output_name is None:
-        output_name = 'stratified_samples.shp'
+        output_name = 'stratified_samples.parquet'
 
-    # Export the GeoDataFrame as a shapefile
+    # Export the GeoDataFrame
     output_shapefile = os.path.join(samples_points_dir, output_name)
     class_count = {}
     gdf_list = []  # Initialize an empty list to store GeoDataFrames
 
+    rng = np.random.default_rng(seed)
+
+    # Sampled candidates of every class, as their random keys and flat pixel indices
+    reservoirs = {class_value: (np.empty(0), np.empty(0, dtype=np.int64))
+                  for class_value in samples_per_class if class_value >= 0}  # Ensure non-negative class values
+
     with rasterio.open(image_path) as src:
-        raster_data = src.read(1)
         transform = src.transform
         crs = src.crs
+        height, width = src.height, src.width
+
+        # Raster rows and columns away from the borders, rows against the height and columns against the width
+        row_range = (int(np.floor(buffer_size)) + 1, int(np.ceil(height - buffer_size)))
+        col_range = (int(np.floor(buffer_size)) + 1, int(np.ceil(width - buffer_size)))
+        class_values = list(reservoirs)
+
+        # Stream the raster in full width strips aligned to its blocks, so only one strip is in memory at a time
+        block_height = src.block_shapes[0][0]
+        strip_height = block_height * max(1, 512 // block_height)
+
+        for row_off in range(0, height, strip_height):
+            window = Window(0, row_off, width, min(strip_height, height - row_off))
+            strip = src.read(1, window=window)
+
+            # Group the pixels of the strip by class in a single pass
+            strip_index, class_starts = bucket_class_pixels(strip, row_off, row_range, col_range, class_values)
+
+            for slot, class_value in enumerate(class_values):
+                class_pixels = strip_index[class_starts[slot]:class_starts[slot + 1]]
+                if len(class_pixels) > 0:
+                    keys, pixel_index = reservoirs[class_value]
+                    reservoirs[class_value] = _update_reservoir(
+                        keys, pixel_index, rng.random(len(class_pixels)), class_pixels, samples_per_class[class_value]
+                    )
+
+    for class_value, (_, pixel_index) in reservoirs.items():
+        rows, cols = np.divmod(np.sort(pixel_index), width)
 
-        for class_value, target_samples in samples_per_class.items():
-            if class_value >= 0:  # Ensure non-negative class values
-                indices = np.where(raster_data == class_value)
+        sampled_coordinates = pixel_centers(transform, rows, cols)
 
-                coordinates = [xy(transform, i, j) for i, j in zip(indices[0], indices[1]) if
-                               i > buffer_size and i < src.width - buffer_size and j > buffer_size and j < src.height - buffer_size]
+        class_count[class_value] = len(sampled_coordinates)
 
-                # Sample points randomly
-                sampled_indices = np.random.choice(
-                    len(coordinates), min(target_samples, len(coordinates)), replace=False
-                )
-                sampled_coordinates = [coordinates[i] for i in sampled_indices]
+        value_list = [class_value] * len(sampled_coordinates)
 
-                class_count[class_value] = len(sampled_coordinates)
+        gdf = gpd.GeoDataFrame(  # Create a GeoDataFrame for each class
+            {'geometry': gpd.points_from_xy(sampled_coordinates[:, 0], sampled_coordinates[:, 1]),
+             'value': value_list}, crs=crs
+        )
+        gdf_list.append(gdf)  # Append the GeoDataFrame to the list
 
-                value_list = [class_value] * len(sampled_coordinates)
+    # Merge all GeoDataFrames into one
+    final_gdf = pd.concat(gdf_list, ignore_index=True)
+    # Export the sample points
+    export_points(final_gdf, output_shapefile)
+
+
+### Private functions ###
+def _update_reservoir(keys, pixel_index, new_keys, new_pixel_index, size):
+    """
+    Merges new candidate pixels into a class reservoir, keeping the candidates with the smallest random keys.
+
+    Giving every pixel an independent uniform key and keeping the smallest ones is a uniform sample without
+    replacement, so the reservoir never grows beyond the requested sample size while the raster is streamed.
+
+    Parameters:
+    - keys (numpy.ndarray): Random keys of the current reservoir.
+    - pixel_index (numpy.ndarray): Flat pixel indices of the current reservoir.
+    - new_keys (numpy.ndarray): Random keys of the new candidates.
+    - new_pixel_index (numpy.ndarray): Flat pixel indices of the new candidates.
+    - size (int): Number of samples to keep.
+
+    Returns:
+    - tuple: Random keys and flat pixel indices of the updated reservoir.
+    """
+    keys = np.concatenate([keys, new_keys])
+    pixel_index = np.concatenate([pixel_index, new_pixel_index])
 
-                gdf = gpd.GeoDataFrame(  # Create a GeoDataFrame for each class
-                    {'geometry': [Point(coord) for coord in sampled_coordinates], 'value': value_list}, crs=crs
-                )
-                gdf_list.append(gdf)  # Append the GeoDataFrame to the list
+    if len(keys) > size:
+        keep = np.argpartition(keys, size)[:size]
+        keys, pixel_index = keys[keep], pixel_index[keep]
 
-        # Merge all GeoDataFrames into one
-        final_gdf = pd.concat(gdf_list, ignore_index=True)
-        # Export to shapefile
-        final_gdf.to_file(output_shapefile)
\ No newline at end of file
+    return keys, pixel_index
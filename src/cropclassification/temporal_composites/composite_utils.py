@@ -0,0 +1,209 @@
+import os
+import warnings
+import numpy as np
+import rasterio
+from datetime import datetime
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def load_img_layers(img_paths):
+    """
+    Loads image layers from a list of image paths.
+
+    The layers are read straight into one preallocated (layers, height, width) array instead of being stacked after
+    reading, which halves the peak memory.
+
+    Args:
+    - img_paths (list of str): List of paths to raster images.
+
+    Returns:
+    - img_layers (numpy.ndarray): Image layers with shape (layers, height, width).
+    - band_profile (rasterio.profiles.Profile): Profile of the last loaded image.
+    - product (list of str): List of product names extracted from image paths.
+    - image_dates (list of str): List of image dates extracted from image paths.
+    """
+    band_profile = None
+    product = []
+    image_dates = []
+
+    if not img_paths:
+        return np.empty((0, 0, 0), dtype=np.float32), band_profile, product, image_dates
+
+    with rasterio.open(img_paths[0]) as src:
+        img_layers = np.empty((len(img_paths), src.height, src.width), dtype=src.dtypes[0])
+
+    for i, img_path in enumerate(img_paths):
+        print(img_path)
+        product_hls = os.path.basename(img_path).split('_')[1]
+        product.append(product_hls)
+        with rasterio.open(img_path) as src:
+            src.read(1, out=img_layers[i])
+            band_profile = src.profile
+        dates = os.path.basename(img_path).split('_')[0]
+        image_dates.append(dates)
+
+    return img_layers, band_profile, product, image_dates
+
+
+def select_date_range(image_dates, start_date, end_date):
+    """
+    Finds the first and last images within a date range with a binary search.
+
+    Args:
+    - image_dates (list of str): Sorted image dates in the format 'YYYYMMDD'.
+    - start_date (datetime): Start of the date range.
+    - end_date (datetime): End of the date range, inclusive.
+
+    Returns:
+    - tuple: Index of the first and last images within the range, or None if no image is within the range.
+    """
+    sorted_dates = np.array([datetime.strptime(date.split('_')[0], "%Y%m%d") for date in image_dates],
+                            dtype='datetime64[s]')
+
+    start_index = int(np.searchsorted(sorted_dates, np.datetime64(start_date, 's'), side='left'))
+    end_index = int(np.searchsorted(sorted_dates, np.datetime64(end_date, 's'), side='right')) - 1
+
+    if start_index > end_index:
+        return None
+    return start_index, end_index
+
+
+def calculate_nan_cv(img_layers):
+    """
+    Calculates the per-pixel coefficient of variation of image layers ignoring NaNs.
+
+    Equivalent to np.nanstd(img_layers, axis=0) / np.nanmean(img_layers, axis=0). With Numba the standard deviation
+    and the mean come out of a single multithreaded Welford pass over the layers, without the float64 temporaries of
+    the NumPy functions, which are used when Numba is not installed.
+
+    Args:
+    - img_layers (numpy.ndarray): Image layers with shape (layers, height, width).
+
+    Returns:
+    - cv_img (numpy.ndarray): Coefficient of variation image as float32.
+    """
+    if numba is not None:
+        cv_img = np.empty(img_layers.shape[1:], dtype=np.float32)
+        _nan_cv_kernel(img_layers, cv_img)
+        return cv_img
+
+    # All-NaN pixels and zero means give NaN and inf like the kernel, without warnings
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        cv_img = np.nanstd(img_layers, axis=0) / np.nanmean(img_layers, axis=0)
+    return cv_img.astype(np.float32)
+
+
+def calculate_nan_quantiles(img_layers, percentiles, block_size=256):
+    """
+    Calculates NaN-aware quantiles along the time axis, one spatial block at a time.
+
+    Each (layers, block_size, block_size) block fits in the CPU cache, and its quantiles are written straight into the
+    preallocated output instead of building the full result in one shot.
+
+    Args:
+    - img_layers (numpy.ndarray): Image layers with shape (layers, height, width).
+    - percentiles (list): Quantiles to calculate, between 0 and 1.
+    - block_size (int): Height and width of the blocks.
+
+    Returns:
+    - percentile_imgs (numpy.ndarray): Quantile images with shape (len(percentiles), height, width).
+    """
+    _, height, width = img_layers.shape
+    percentile_imgs = np.empty((len(percentiles), height, width), dtype=np.float32)
+
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            block = img_layers[:, row:row + block_size, col:col + block_size]
+            percentile_imgs[:, row:row + block_size, col:col + block_size] = _sorted_nanquantile(block, percentiles)
+
+    return percentile_imgs
+
+
+def export_img(img, output_filepath, img_profile):
+    """
+    Exports a composite image as a single band LZW compressed GeoTIFF with NaN as nodata.
+
+    Args:
+    - img (numpy.ndarray): Composite image.
+    - output_filepath (str): Path of the output image.
+    - img_profile (rasterio.profiles.Profile): Profile used for exporting the image.
+    """
+    os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
+
+    img_profile['nodata'] = np.nan
+    img_profile['compress'] = 'lzw'
+
+    with rasterio.open(output_filepath, 'w', **img_profile) as dst:
+        dst.write(img, 1)
+
+
+### Private functions ###
+
+def _sorted_nanquantile(img_layers, percentiles):
+    """
+    Calculates NaN-aware quantiles along the time axis from a single sort of the layers.
+
+    np.sort places the NaNs after the valid values of each pixel, so every quantile is a linear interpolation between
+    two ranks of the valid observations, the same result as np.nanquantile with the default 'linear' method. All
+    quantiles come out of the one sort instead of a general-purpose selection per quantile.
+
+    Args:
+    - img_layers (numpy.ndarray): Image layers with shape (layers, height, width).
+    - percentiles (list): Quantiles to calculate, between 0 and 1.
+
+    Returns:
+    - quantile_imgs (numpy.ndarray): Quantile images with shape (len(percentiles), height, width), NaN where no layer
+      is valid.
+    """
+    sorted_layers = np.sort(img_layers, axis=0)
+    valid_count = img_layers.shape[0] - np.isnan(sorted_layers).sum(axis=0)
+
+    # Fractional rank of every quantile among the valid observations of each pixel
+    rank = np.asarray(percentiles, dtype=np.float64)[:, None, None] * np.maximum(valid_count - 1, 0)
+    lower = np.floor(rank).astype(np.intp)
+    upper = np.ceil(rank).astype(np.intp)
+
+    lower_values = np.take_along_axis(sorted_layers, lower, axis=0)
+    upper_values = np.take_along_axis(sorted_layers, upper, axis=0)
+    quantile_imgs = lower_values + (upper_values - lower_values) * (rank - lower)
+    quantile_imgs[:, valid_count == 0] = np.nan
+
+    return quantile_imgs
+
+
+if numba is not None:
+    @numba.njit(parallel=True, error_model='numpy', cache=True)
+    def _nan_cv_kernel(img_layers, cv_img):
+        """
+        Calculates the coefficient of variation of every pixel with a Welford update per valid observation.
+
+        Every thread handles whole rows and keeps the running count, mean and sum of squared differences of a row, so
+        the layers are read once, row by row, in memory order.
+        """
+        n_layers, height, width = img_layers.shape
+
+        for row in numba.prange(height):
+            count = np.zeros(width, dtype=np.int64)
+            mean = np.zeros(width, dtype=np.float64)
+            m2 = np.zeros(width, dtype=np.float64)
+
+            for layer in range(n_layers):
+                for col in range(width):
+                    value = np.float64(img_layers[layer, row, col])
+                    if not np.isnan(value):
+                        count[col] += 1
+                        delta = value - mean[col]
+                        mean[col] += delta / count[col]
+                        m2[col] += delta * (value - mean[col])
+
+            # Population standard deviation over the valid observations, as np.nanstd does
+            for col in range(width):
+                if count[col] == 0:
+                    cv_img[row, col] = np.nan
+                else:
+                    cv_img[row, col] = np.sqrt(m2[col] / count[col]) / mean[col]
@@ -0,0 +1,65 @@
+import glob
+import os
+from datetime import datetime
+from cropclassification.temporal_composites.composite_utils import (
+    calculate_nan_cv,
+    calculate_nan_quantiles,
+    export_img,
+    load_img_layers,
+    select_date_range,
+)
+
+
+def calculate_monthly_composites(base_dir: str, date_ranges: dict, bands: list,
+                                 percentiles=(0.10, 0.25, 0.50, 0.75, 0.90), cv=True) -> None:
+    """
+    Calculates the coefficient of variation and percentile composites of the cloudless HLS images in a single pass.
+
+    The images of each band are loaded once, and every date range is sliced from that stack to export its coefficient
+    of variation and its percentiles before the next band is loaded.
+
+    Args:
+    - base_dir (str): Locate the hls cloudless images and save the composite images.
+    - date_ranges (dict): Dictionary mapping band-date ranges to start and end dates.
+    - bands (list): List of interest bands.
+    - percentiles (list): Quantiles to export, between 0 and 1. Empty to skip the percentile composites.
+    - cv (bool): Whether to export the coefficient of variation composites.
+    """
+    cv_dir = os.path.join(base_dir, 'temporal_composites', 'inputdata', 'variation_coefficient')
+    percentiles_dir = os.path.join(base_dir, 'temporal_composites', 'percentiles')
+
+    for band in bands:
+        band_date_ranges = [date_range for date_range_key, date_range in date_ranges.items() if band in date_range_key]
+        if not band_date_ranges:
+            continue
+
+        # Sort the images by their date prefix, so the layers of a date range are contiguous
+        path_pattern = f'**/hls_cloudless/**/*{band}.tif'
+        img_paths = sorted(glob.glob(os.path.join(base_dir, path_pattern), recursive=True), key=os.path.basename)
+        img_layers, img_profile, product, image_dates = load_img_layers(img_paths)
+
+        for start_date, end_date in band_date_ranges:
+            date_range_indices = select_date_range(image_dates, start_date, end_date)
+            if date_range_indices is None:
+                continue
+
+            start_index, end_index = date_range_indices
+            current_date = f"{datetime.strptime(image_dates[start_index], '%Y%m%d').month:02d}"
+            selected_images = img_layers[start_index:end_index + 1]
+
+            if cv:
+                # Export CV image
+                output_filepath_cv = os.path.join(cv_dir, f"{current_date}_{band}_cv.tif")
+                export_img(calculate_nan_cv(selected_images), output_filepath_cv, img_profile)
+                print(f"Saved CV image: {output_filepath_cv}")
+
+            if len(percentiles) > 0:
+                percentile_imgs = calculate_nan_quantiles(selected_images, percentiles)
+
+                # Export percentile images
+                for percentile, img_data in zip(percentiles, percentile_imgs):
+                    quantile_label = f"{percentile * 100:g}"
+                    output_filepath_percentile = os.path.join(percentiles_dir,
+                                                              f"{current_date}_{band}_p{quantile_label}.tif")
+                    export_img(img_data, output_filepath_percentile, img_profile)
+                    print(f"Saved {quantile_label}% percentile image: {output_filepath_percentile}")
@@ -1,6 +1,10 @@
 from datetime import datetime
 import calendar
 
+# Dictionary mapping month numbers to month names
+MONTH_NAMES = {1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June',
+               7: 'July', 8: 'August', 9: 'September', 10: 'October', 11: 'November', 12: 'December'}
+
 
 def get_band_dates(bands: list, interval_type='bi_monthly', year=2022, custom_intervals=None) -> dict:
     """
@@ -18,9 +22,8 @@ def get_band_dates(bands: list, interval_type='bi_monthly', year=2022, custom_in
     Returns:
         dict: Dictionary containing date ranges for the specified bands and intervals.
     """
-    # Dictionary mapping month numbers to month names
-    month_names = {1: 'January', 2: 'February', 3: 'March', 4: 'April', 5: 'May', 6: 'June',
-                   7: 'July', 8: 'August', 9: 'September', 10: 'October', 11: 'November', 12: 'December'}
+    # Last day of every month of the year, computed once
+    month_end = tuple(calendar.monthrange(year, month)[1] for month in range(1, 13))
 
     # Dictionary to store date ranges
     date_ranges = {}
@@ -31,21 +34,21 @@ def get_band_dates(bands: list, interval_type='bi_monthly', year=2022, custom_in
         if interval_type == 'bi_monthly':
             # Adding bi-monthly intervals
             for month in range(1, 13, 2):
-                month_name_1 = month_names[month].lower()
-                month_name_2 = month_names[min(month + 1, 12)].lower()
+                month_name_1 = MONTH_NAMES[month].lower()
+                month_name_2 = MONTH_NAMES[min(month + 1, 12)].lower()
                 start_date = datetime(year, month, 1)
-                end_day = calendar.monthrange(year, min(month + 1, 12))[1]  # Last day of the month
+                end_day = month_end[min(month + 1, 12) - 1]  # Last day of the month
                 end_date = datetime(year, min(month + 1, 12), end_day)
                 date_ranges[f'{band}_{month_name_1}_{month_name_2}'] = (start_date, end_date)
         elif interval_type == 'quarterly':
             # Adding quarterly intervals
             quarters = [(1, 3), (4, 6), (7, 9), (10, 12)]
             for quarter_num, (start_month, end_month) in enumerate(quarters, start=1):
-                start_month_name = month_names[start_month]
-                end_month_name = month_names[end_month]
+                start_month_name = MONTH_NAMES[start_month]
+                end_month_name = MONTH_NAMES[end_month]
                 quarter_name = f'Q{quarter_num}_{start_month_name}_{end_month_name}'
                 start_date = datetime(year, start_month, 1)
-                end_day = calendar.monthrange(year, end_month)[1]  # Last day of the month
+                end_day = month_end[end_month - 1]  # Last day of the month
                 end_date = datetime(year, end_month, end_day)
                 date_ranges[f'{band}_{quarter_name}'] = (start_date, end_date)
         elif interval_type == 'semester':
@@ -56,11 +59,11 @@ def get_band_dates(bands: list, interval_type='bi_monthly', year=2022, custom_in
             # Adding custom intervals
             if custom_intervals:
                 for index, (start_month, end_month) in enumerate(custom_intervals, start=1):
-                    start_month_name = month_names[start_month]
-                    end_month_name = month_names[end_month]
+                    start_month_name = MONTH_NAMES[start_month]
+                    end_month_name = MONTH_NAMES[end_month]
                     interval_name = f'{band}_{start_month_name.lower()}_{end_month_name.lower()}'
                     start_date = datetime(year, start_month, 1)
-                    end_day = calendar.monthrange(year, end_month)[1]  # Last day of the month
+                    end_day = month_end[end_month - 1]  # Last day of the month
                     end_date = datetime(year, end_month, end_day)
                     date_ranges[interval_name] = (start_date, end_date)
         elif interval_type == 'annual':
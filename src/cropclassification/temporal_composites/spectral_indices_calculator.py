@@ -1,191 +1,453 @@
+import multiprocessing
 import os
-import glob
+import sys
 import numpy as np
 import rasterio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from cropclassification.raster_utils import thread_local_readers, tile_windows
 
-def spectral_indices(base_dir)->None:
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Band descriptions of the indices image, in the order the indices are calculated
+INDEX_NAMES = ('evi', 'ndbi', 'ndwi', 'nbr', 'ndti')
+
+# Largest finite value of the half floats the indices are stored as
+HALF_FLOAT_MAX = float(np.finfo(np.float16).max)
+
+# Width and height of the internal blocks of the indices image
+INDEX_BLOCK_SIZE = 512
+
+# GDAL block cache in megabytes, split evenly between the date processes
+GDAL_CACHEMAX_MB = 1024
+
+# Pixels per chunk of the NumPy index calculation, small enough for its temporaries to stay in the L2 cache
+NUMPY_CHUNK_SIZE = 16384
+
+def spectral_indices(base_dir, tile_size=512, max_workers=5, max_processes=None)->None:
     """
     Processes HLS images, calculates spectral indices, and exports them to specified directories.
 
+    The EVI, NDBI, NDWI, NBR and NDTI of every percentile image are exported as the bands of a single
+    '{date}_indices_{percentile}.tif' image.
+
     Args:
-        input_dir (str): Root directory containing HLS percentiles
-        output_dir (str): Root directory to export the spectral indices
-        percentiles_folder (str): Folder containing the HLS percentiles
+        base_dir (str): Root directory containing the HLS percentiles, where the spectral indices are exported
+        tile_size (int): Width and height of the processed windows, rounded up to whole blocks of the indices image.
+        max_workers (int): Number of threads reading the bands of the next windows.
+        max_processes (int): Number of dates processed in parallel, by default half of the CPUs.
 
     Returns:
         None
     """
-    hls_imgs = glob.glob(os.path.join(base_dir, '**', 'percentiles', '**', '*B02_p*.tif'), recursive=True)
-    for hls_img in hls_imgs:
-        print(hls_img)
-        img_index = os.path.basename(hls_img).split('_')[0]
-        basedir_indices = os.path.join(base_dir, 'temporal_composites', 'inputdata', 'spectral_indexes')
-        dir_output_date = os.path.join(basedir_indices, img_index)
-        os.makedirs(dir_output_date, exist_ok=True)
-
-        blue_band_hls = hls_img
-        red_band_hls = hls_img.replace('B02', 'B04')
-        nir_band_hls = hls_img.replace('B02', 'NIR')
-        swr1_band_hls = hls_img.replace('B02', 'SWR1')
-        swr2_band_hls = hls_img.replace('B02', 'SWR2')
-
-        blue_band, _ = _read_raster(blue_band_hls)
-        del blue_band_hls
-        red_band, _ = _read_raster(red_band_hls)
-        del red_band_hls
-        nir_band, src_profile = _read_raster(nir_band_hls)
-        del nir_band_hls
-        swr1_band, _ = _read_raster(swr1_band_hls)
-        del swr1_band_hls
-        swr2_band, _ = _read_raster(swr2_band_hls)
-        del swr2_band_hls
-
-        evi = _calculate_evi(nir_band, red_band, blue_band)
-        del blue_band, red_band
-        ndbi = _calculate_ndbi(swr1_band, nir_band)
-        ndwi = _calculate_ndwi(nir_band, swr1_band)
-        nbr = _calculate_nbr(nir_band, swr2_band)
-        del nir_band
-        ndti = _calculate_ndti(swr1_band, swr2_band)
-        del swr1_band, swr2_band
-
-        evi_output = os.path.join(dir_output_date, os.path.basename(hls_img).replace('B02', 'evi'))
-        ndbi_output = os.path.join(dir_output_date, os.path.basename(hls_img).replace('B02', 'ndbi'))
-        ndwi_output = os.path.join(dir_output_date, os.path.basename(hls_img).replace('B02', 'ndwi'))
-        nbr_output = os.path.join(dir_output_date, os.path.basename(hls_img).replace('B02', 'nbr'))
-        ndti_output = os.path.join(dir_output_date, os.path.basename(hls_img).replace('B02', 'ndti'))
-
-        _export_index_to_drive(evi, evi_output, src_profile)
-        _export_index_to_drive(ndbi, ndbi_output, src_profile)
-        _export_index_to_drive(ndwi, ndwi_output, src_profile)
-        _export_index_to_drive(nbr, nbr_output, src_profile)
-        _export_index_to_drive(ndti, ndti_output, src_profile)
-
+    basedir_indices = os.path.join(base_dir, 'temporal_composites', 'inputdata', 'spectral_indexes')
+    tile_size = -(-tile_size // INDEX_BLOCK_SIZE) * INDEX_BLOCK_SIZE
+    percentile_bands = list(_find_percentile_bands(base_dir))
+    cpu_count = os.cpu_count() or 1
+    max_processes = max(1, min(len(percentile_bands), max_processes or cpu_count // 2))
+
+    # Every date process gets an equal share of the GDAL block cache and of the CPUs
+    gdal_cachemax = max(1, GDAL_CACHEMAX_MB // max_processes)
+    num_threads = max(1, cpu_count // max_processes)
+    date_args = (basedir_indices, tile_size, max_workers, gdal_cachemax, num_threads)
+
+    if max_processes == 1:
+        for hls_name, band_paths in percentile_bands:
+            _process_one_date(hls_name, band_paths, *date_args)
+        return
+
+    # Compile the kernel into the on-disk cache once, so the workers load it instead of compiling it
+    _warm_up_kernel({_band_dtype(band_paths) for _, band_paths in percentile_bands})
+
+    # Start the workers from a clean process instead of a fork of the GDAL and Numba threads
+    mp_context = multiprocessing.get_context('forkserver' if sys.platform.startswith('linux') else 'spawn')
+    with ProcessPoolExecutor(max_workers=max_processes, mp_context=mp_context, initializer=_init_date_worker,
+                             initargs=(num_threads,)) as executor:
+        futures = [executor.submit(_process_one_date, hls_name, band_paths, *date_args)
+                   for hls_name, band_paths in percentile_bands]
+        for future in as_completed(futures):
+            future.result()
 
 
 ### Private functions #####
 
-def _read_raster(input_raster):
+def _init_date_worker(num_threads):
+    """
+    Limits the Numba threads of a date worker process, so the parallel dates do not oversubscribe the CPUs.
+
+    Args:
+        num_threads (int): Number of threads of the index calculation in the process.
+    """
+    if numba is not None:
+        numba.set_num_threads(min(num_threads, numba.config.NUMBA_NUM_THREADS))
+
+def _warm_up_kernel(band_dtypes):
+    """
+    Compiles the fused index kernel on a single pixel, storing it in Numba's cache directory.
+
+    Args:
+        band_dtypes (set): Data types of the band buffers to compile the kernel for.
+    """
+    if numba is not None:
+        for band_dtype in band_dtypes:
+            _calculate_all_indices(*[np.ones(1, dtype=band_dtype)] * 5)
+
+def _band_dtype(band_paths):
     """
-    Reads raster image using rasterio and returns rasterband and profile.
+    Finds the data type that holds the stored values of every band without loss.
 
     Args:
-        input_raster (str): Path to the input raster image.
+        band_paths (list): Paths of the NIR, red, blue, SWIR1 and SWIR2 bands.
 
     Returns:
-        tuple: A tuple containing rasterband and source profile.
+        numpy.dtype: Data type of the band buffers.
     """
-    with rasterio.open(input_raster) as src:
-        rasterband = src.read(1)
-        src_profile = src.profile
-    return rasterband, src_profile
+    band_dtypes = []
+    for band_path in band_paths:
+        with rasterio.open(band_path) as src:
+            band_dtypes.append(src.dtypes[0])
+    return np.result_type(*band_dtypes)
 
-def _calculate_evi(nir_band, red_band, blue_band):
+def _process_one_date(hls_name, band_paths, basedir_indices, tile_size, max_workers, gdal_cachemax, num_threads):
     """
-    Calculates the Enhanced Vegetation Index (EVI) using the specified bands.
+    Calculates the spectral indices of one percentile image and exports them as the bands of one image.
+
+    Args:
+        hls_name (str): File name of the blue band percentile image.
+        band_paths (list): Paths of the NIR, red, blue, SWIR1 and SWIR2 bands.
+        basedir_indices (str): Directory where the spectral indices are exported, in a subdirectory per date.
+        tile_size (int): Width and height of the processed windows.
+        max_workers (int): Number of threads reading the bands of the next windows.
+        gdal_cachemax (int): GDAL block cache of the process in megabytes.
+        num_threads (int): Number of threads GDAL decodes and compresses the blocks with.
+    """
+    print(band_paths[2])
+    img_index = hls_name.split('_')[0]
+    dir_output_date = os.path.join(basedir_indices, img_index)
+    os.makedirs(dir_output_date, exist_ok=True)
+
+    index_output = os.path.join(dir_output_date, hls_name.replace('_B02_', '_indices_', 1))
+
+    def read_band(band, window, bands):
+        _read_raster(band_readers()[band], window, out=bands[band])
+
+    band_srcs = [rasterio.open(band_path) for band_path in band_paths]
+    try:
+        index_profile = _index_profile(band_srcs[0].profile, num_threads)
+        band_scaling = _band_scaling(band_srcs)
+    finally:
+        for src in band_srcs:
+            src.close()
+
+    # One band buffer per window in flight and a single index buffer, edge windows use the start of their buffer
+    band_buffers = np.empty((max_workers, len(band_paths) * tile_size * tile_size), dtype=_band_dtype(band_paths))
+    index_buffer = np.empty(len(INDEX_NAMES) * tile_size * tile_size, dtype=np.float32)
+
+    def calculate_window(window, bands, band_futures):
+        for band_future in band_futures:
+            band_future.result()
+        indices = index_buffer[:len(INDEX_NAMES) * window.height * window.width].reshape(
+            len(INDEX_NAMES), window.height, window.width)
+        _calculate_all_indices(*bands, out=indices, band_scaling=band_scaling)
+        _export_indices_to_drive(indices, index_dst, window)
+
+    with ExitStack() as stack:
+        # GDAL block cache and threads of this process, also applied to the reader threads
+        stack.enter_context(rasterio.Env(GDAL_CACHEMAX=gdal_cachemax, GDAL_NUM_THREADS=str(num_threads)))
+        # Each reader thread opens its own handles on the five bands, closed after the executor has been shut down
+        band_readers = stack.enter_context(thread_local_readers(band_paths))
+        index_dst = stack.enter_context(rasterio.open(index_output, 'w', **index_profile))
+        index_dst.descriptions = INDEX_NAMES
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+
+        # Workers read the next windows while this thread calculates and writes the indices
+        pending = deque()
+        windows = tile_windows(index_profile['width'], index_profile['height'], tile_size)
+        for window_number, window in enumerate(windows):
+            # The buffer of this window was released when the window max_workers places before it was calculated
+            bands = band_buffers[window_number % max_workers][:len(band_paths) * window.height * window.width].reshape(
+                len(band_paths), window.height, window.width)
+            pending.append((window, bands, [executor.submit(read_band, band, window, bands)
+                                            for band in range(len(band_paths))]))
+            # Bound the number of windows read ahead to keep memory constant
+            if len(pending) >= max_workers:
+                calculate_window(*pending.popleft())
+        while pending:
+            calculate_window(*pending.popleft())
+
+def _find_percentile_bands(base_dir):
+    """
+    Walks base_dir once and yields the blue band percentile images found under a 'percentiles' directory.
+
+    Args:
+        base_dir (str): Root directory containing the HLS percentiles.
+
+    Yields:
+        tuple: File name of the blue band image, and the paths of its NIR, red, blue, SWIR1 and SWIR2 bands.
+    """
+    for dir_path, _, file_names in os.walk(base_dir):
+        if 'percentiles' not in os.path.relpath(dir_path, base_dir).split(os.sep):
+            continue
+        for file_name in sorted(file_names):
+            if '_B02_p' in file_name and file_name.endswith('.tif'):
+                yield file_name, [os.path.join(dir_path, file_name.replace('_B02_', f'_{band}_', 1))
+                                  for band in ('NIR', 'B04', 'B02', 'SWR1', 'SWR2')]
+
+def _read_raster(src, window, out=None):
+    """
+    Reads a window of the first band of an open raster image.
+
+    Args:
+        src (rasterio.io.DatasetReader): Open raster image.
+        window (rasterio.windows.Window): Window to read.
+        out (numpy.ndarray): Optional array with the shape of the window to read the band into.
+
+    Returns:
+        numpy.ndarray: Band values within the window.
+    """
+    return src.read(1, window=window, out=out)
+
+def _index_profile(src_profile, num_threads):
+    """
+    Builds the profile of the tiled, pixel interleaved and DEFLATE compressed half float indices image.
+
+    Args:
+        src_profile (dict): Source profile of the raster.
+        num_threads (int): Number of threads compressing the blocks.
+
+    Returns:
+        dict: Profile of the indices image.
+    """
+    index_profile = src_profile.copy()
+    index_profile['dtype'] = 'float32'
+    index_profile['count'] = len(INDEX_NAMES)
+    index_profile['nodata'] = np.nan
+    index_profile.update(compress='deflate', predictor=3, nbits=16, interleave='pixel', tiled=True,
+                         blockxsize=INDEX_BLOCK_SIZE, blockysize=INDEX_BLOCK_SIZE, num_threads=num_threads,
+                         BIGTIFF='IF_SAFER')
+    return index_profile
+
+def _calculate_all_indices(nir_band, red_band, blue_band, swr1_band, swr2_band, out=None, band_scaling=None):
+    """
+    Calculates the EVI, NDBI, NDWI, NBR and NDTI indices, in one fused Numba kernel when Numba is installed.
 
     Args:
         nir_band (numpy.ndarray): Near-Infrared band.
         red_band (numpy.ndarray): Red band.
         blue_band (numpy.ndarray): Blue band.
+        swr1_band (numpy.ndarray): Shortwave Infrared band 1.
+        swr2_band (numpy.ndarray): Shortwave Infrared band 2.
+        out (numpy.ndarray): Optional contiguous float32 array with shape (5, height, width) to calculate into.
+        band_scaling (numpy.ndarray): Optional scale, offset and nodata value of every band, see _band_scaling.
 
     Returns:
-        numpy.ndarray: Computed EVI values.
+        numpy.ndarray: Computed EVI, NDBI, NDWI, NBR and NDTI values as a float32 array with shape (5, height, width).
     """
-    evi_numerator = nir_band - red_band
-    evi_denominator = nir_band + 6 * red_band - 7.5 * blue_band + 1
-    mask = evi_denominator != 0
-    evi = np.zeros_like(nir_band, dtype=np.float32)
-    evi[mask] = 2.5 * evi_numerator[mask] / evi_denominator[mask]
-    return evi
+    if out is None:
+        out = np.empty((5, *nir_band.shape), dtype=np.float32)
+    if band_scaling is None:
+        band_scaling = np.array([[1] * 5, [0] * 5, [np.nan] * 5], dtype=np.float32)
+
+    bands = [np.ascontiguousarray(band).ravel() for band in (nir_band, red_band, blue_band, swr1_band, swr2_band)]
+    flat_indices = out.reshape(5, -1)
+
+    if numba is None:
+        # Calculate over chunks of pixels so the NumPy temporaries stay in the CPU cache
+        for start in range(0, nir_band.size, NUMPY_CHUNK_SIZE):
+            nir, red, blue, swr1, swr2 = (_scale_band(band[start:start + NUMPY_CHUNK_SIZE], *band_scaling[:, i])
+                                          for i, band in enumerate(bands))
+            evi, ndbi, ndwi, nbr, ndti = flat_indices[:, start:start + NUMPY_CHUNK_SIZE]
+            _calculate_evi(nir, red, blue, out=evi)
+            _calculate_ndbi(swr1, nir, out=ndbi)
+            # NDWI is the negated NDBI
+            np.negative(ndbi, out=ndwi)
+            _calculate_nbr(nir, swr2, out=nbr)
+            _calculate_ndti(swr1, swr2, out=ndti)
+        return out
+
+    _fused_indices_kernel(*bands, *flat_indices, band_scaling)
+    return out
+
+def _band_scaling(band_srcs):
+    """
+    Collects the scale, offset and nodata value of the first band of every open band image.
+
+    Args:
+        band_srcs (list): Open NIR, red, blue, SWIR1 and SWIR2 band images.
+
+    Returns:
+        numpy.ndarray: Float32 array with shape (3, bands), the scales, the offsets and the nodata values, NaN for the
+        bands without one.
+    """
+    return np.array([[src.scales[0] for src in band_srcs],
+                     [src.offsets[0] for src in band_srcs],
+                     [np.nan if src.nodata is None else src.nodata for src in band_srcs]], dtype=np.float32)
 
-def _calculate_ndbi(swr1_band, nir_band):
+def _scale_band(band, scale, offset, nodata):
     """
-    Calculates the Normalized Difference Built-Up Index (NDBI) using specified bands.
+    Converts band values to float32 reflectances, value * scale + offset, with NaN where the band is nodata.
 
     Args:
-        swr1_band (numpy.ndarray): Shortwave Infrared band 1.
-        nir_band (numpy.ndarray): Near-Infrared band.
+        band (numpy.ndarray): Band values in their stored data type.
+        scale (float): Scale of the band.
+        offset (float): Offset of the band.
+        nodata (float): Nodata value of the band, NaN if it has none.
 
     Returns:
-        numpy.ndarray: Computed NDBI values.
+        numpy.ndarray: Reflectances, the band itself when it is already float32 without scaling or nodata value.
     """
-    ndbi_numerator = swr1_band - nir_band
-    ndbi_denominator = swr1_band + nir_band
-    mask = ndbi_denominator != 0
-    ndbi = np.zeros_like(swr1_band, dtype=np.float32)
-    ndbi[mask] = ndbi_numerator[mask] / ndbi_denominator[mask]
-    return ndbi
+    if band.dtype == np.float32 and scale == 1 and offset == 0 and np.isnan(nodata):
+        return band
 
-def _calculate_ndwi(nir_band, swr1_band):
+    reflectance = band.astype(np.float32)
+    reflectance *= scale
+    reflectance += offset
+    if not np.isnan(nodata):
+        reflectance[band == nodata] = np.nan
+    return reflectance
+
+def _calculate_evi(nir_band, red_band, blue_band, out=None):
     """
-    Calculates the Normalized Difference Water Index (NDWI) using specified bands.
+    Calculates the Enhanced Vegetation Index (EVI) using the specified bands.
 
     Args:
         nir_band (numpy.ndarray): Near-Infrared band.
-        swr1_band (numpy.ndarray): Shortwave Infrared band 1.
+        red_band (numpy.ndarray): Red band.
+        blue_band (numpy.ndarray): Blue band.
+        out (numpy.ndarray): Optional float32 array to calculate the index into.
 
     Returns:
-        numpy.ndarray: Computed NDWI values.
+        numpy.ndarray: Computed EVI values.
+    """
+    evi_numerator = 2.5 * (nir_band - red_band)
+    evi_denominator = nir_band + 6 * red_band - 7.5 * blue_band + 1
+    if out is None:
+        out = np.zeros_like(nir_band, dtype=np.float32)
+    else:
+        out.fill(0)
+    np.divide(evi_numerator, evi_denominator, out=out, where=evi_denominator != 0)
+    return out
+
+def _calculate_ndbi(swr1_band, nir_band, out=None):
     """
-    ndwi_numerator = nir_band - swr1_band
-    ndwi_denominator = nir_band + swr1_band
-    mask = ndwi_denominator != 0
-    ndwi = np.zeros_like(nir_band, dtype=np.float32)
-    ndwi[mask] = ndwi_numerator[mask] / ndwi_denominator[mask]
-    return ndwi
+    Calculates the Normalized Difference Built-Up Index (NDBI) using specified bands.
+
+    Args:
+        swr1_band (numpy.ndarray): Shortwave Infrared band 1.
+        nir_band (numpy.ndarray): Near-Infrared band.
+        out (numpy.ndarray): Optional float32 array to calculate the index into.
 
-def _calculate_nbr(nir_band, swr2_band):
+    Returns:
+        numpy.ndarray: Computed NDBI values.
+    """
+    ndbi_numerator = swr1_band - nir_band
+    ndbi_denominator = swr1_band + nir_band
+    if out is None:
+        out = np.zeros_like(swr1_band, dtype=np.float32)
+    else:
+        out.fill(0)
+    np.divide(ndbi_numerator, ndbi_denominator, out=out, where=ndbi_denominator != 0)
+    return out
+
+def _calculate_nbr(nir_band, swr2_band, out=None):
     """
     Calculates the Normalized Burn Ratio (NBR) using specified bands.
 
     Args:
         nir_band (numpy.ndarray): Near-Infrared band.
         swr2_band (numpy.ndarray): Shortwave Infrared band 2.
+        out (numpy.ndarray): Optional float32 array to calculate the index into.
 
     Returns:
         numpy.ndarray: Computed NBR values.
     """
     nbr_numerator = nir_band - swr2_band
     nbr_denominator = nir_band + swr2_band
-    mask = nbr_denominator != 0
-    nbr = np.zeros_like(nir_band, dtype=np.float32)
-    nbr[mask] = nbr_numerator[mask] / nbr_denominator[mask]
-    return nbr
-
-def _calculate_ndti(swr1_band, swr2_band):
+    if out is None:
+        out = np.zeros_like(nir_band, dtype=np.float32)
+    else:
+        out.fill(0)
+    np.divide(nbr_numerator, nbr_denominator, out=out, where=nbr_denominator != 0)
+    return out
+
+def _calculate_ndti(swr1_band, swr2_band, out=None):
     """
     Calculates the Normalized Difference Turbidity Index (NDTI) using specified bands.
 
     Args:
         swr1_band (numpy.ndarray): Shortwave Infrared band 1.
         swr2_band (numpy.ndarray): Shortwave Infrared band 2.
+        out (numpy.ndarray): Optional float32 array to calculate the index into.
 
     Returns:
         numpy.ndarray: Computed NDTI values.
     """
     ndti_numerator = swr1_band - swr2_band
     ndti_denominator = swr1_band + swr2_band
-    mask = ndti_denominator != 0
-    ndti = np.zeros_like(swr1_band, dtype=np.float32)
-    ndti[mask] = ndti_numerator[mask] / ndti_denominator[mask]
-    return ndti
-
-def _export_index_to_drive(index, output_path, src_profile):
+    if out is None:
+        out = np.zeros_like(swr1_band, dtype=np.float32)
+    else:
+        out.fill(0)
+    np.divide(ndti_numerator, ndti_denominator, out=out, where=ndti_denominator != 0)
+    return out
+
+def _export_indices_to_drive(indices, dst, window):
     """
-    Exports the calculated index to a GeoTIFF file.
+    Exports a window of the calculated indices, clipped in place to the finite half float range.
 
     Args:
-        index (numpy.ndarray): Index values to be exported.
-        output_path (str): Output path for the GeoTIFF file.
-        src_profile (dict): Source profile of the raster.
+        indices (numpy.ndarray): Index values to be exported, with shape (5, height, width).
+        dst (rasterio.io.DatasetWriter): Open indices image.
+        window (rasterio.windows.Window): Window of the index values.
 
     Returns:
         None
     """
-    src_profile['dtype'] = 'float32'
-    src_profile['compress'] = 'lzw'
-    src_profile['nodata'] = np.nan
-    with rasterio.open(output_path, 'w', **src_profile) as dst:
-        dst.write(index, 1)
-
+    np.clip(indices, -HALF_FLOAT_MAX, HALF_FLOAT_MAX, out=indices)
+    dst.write(indices, window=window)
+
+if numba is not None:
+    @numba.njit(inline='always', cache=True)
+    def _scale_band_value(value, band_scaling, band):
+        """
+        Converts a stored band value to a float32 reflectance, NaN where it is the nodata value of the band.
+        """
+        value = np.float32(value)
+        return value * band_scaling[0, band] + band_scaling[1, band] if value != band_scaling[2, band] \
+            else np.float32(np.nan)
+
+    # NaN-aware fastmath flags, 'nnan' would let LLVM assume the nodata NaNs away
+    @numba.njit(parallel=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, boundscheck=False, cache=True)
+    def _fused_indices_kernel(nir, red, blue, swr1, swr2, evi, ndbi, ndwi, nbr, ndti, band_scaling):
+        """
+        Calculates the five indices of every pixel of the flattened bands, with 0 where a denominator is 0.
+        """
+        n_pixels = nir.shape[0]
+        chunk_size = 4096
+
+        for chunk in numba.prange((n_pixels + chunk_size - 1) // chunk_size):
+            for i in range(chunk * chunk_size, min((chunk + 1) * chunk_size, n_pixels)):
+                nir_i = _scale_band_value(nir[i], band_scaling, 0)
+                red_i = _scale_band_value(red[i], band_scaling, 1)
+                blue_i = _scale_band_value(blue[i], band_scaling, 2)
+                swr1_i = _scale_band_value(swr1[i], band_scaling, 3)
+                swr2_i = _scale_band_value(swr2[i], band_scaling, 4)
+
+                evi_denominator = nir_i + np.float32(6) * red_i - np.float32(7.5) * blue_i + np.float32(1)
+                evi[i] = np.float32(2.5) * (nir_i - red_i) / evi_denominator if evi_denominator != 0 else np.float32(0)
+
+                # NDWI shares the NDBI sum and difference with the opposite sign
+                swr1_nir_sum = swr1_i + nir_i
+                ndbi_i = (swr1_i - nir_i) / swr1_nir_sum if swr1_nir_sum != 0 else np.float32(0)
+                ndbi[i] = ndbi_i
+                ndwi[i] = -ndbi_i
+
+                nbr_denominator = nir_i + swr2_i
+                nbr[i] = (nir_i - swr2_i) / nbr_denominator if nbr_denominator != 0 else np.float32(0)
+
+                ndti_denominator = swr1_i + swr2_i
+                ndti[i] = (swr1_i - swr2_i) / ndti_denominator if ndti_denominator != 0 else np.float32(0)